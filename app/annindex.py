@@ -0,0 +1,130 @@
+
+import math, time
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from .config import (FAISS_INDEX, FAISS_HNSW_MIN_VECTORS, FAISS_IVF_MIN_VECTORS, FAISS_HNSW_M,
+                     FAISS_EF_CONSTRUCTION, FAISS_EF_SEARCH, FAISS_NPROBE, FAISS_TRAIN_SAMPLE, FAISS_PQ_M)
+
+# Index layouts by corpus size (all inner product over normalized vectors, wrapped in IndexIDMap2):
+#   flat    exact scan, 4 bytes/dim                          small corpora (default below FAISS_HNSW_MIN_VECTORS)
+#   hnsw    HNSW graph over 8-bit scalar-quantized vectors   ~1 byte/dim + graph links
+#   ivf_sq  inverted lists of 8-bit scalar-quantized vectors ~1 byte/dim, probes FAISS_NPROBE lists
+#   ivf_pq  inverted lists of product-quantized codes        ~1 byte per 4 dims (default above FAISS_IVF_MIN_VECTORS)
+KINDS = ("flat", "hnsw", "ivf_sq", "ivf_pq")
+MIN_TRAIN_PER_LIST = 39  # k-means needs this many points per centroid to train cleanly
+
+def _nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but never fewer than MIN_TRAIN_PER_LIST points per list to train on
+    return int(min(65536, max(16, min(4 * math.sqrt(max(n, 1)), n // MIN_TRAIN_PER_LIST))))
+
+def _pq_m(d: int) -> int:
+    # default 4 dims per 8-bit code; the sub-quantizer count must divide d
+    m = max(1, min(FAISS_PQ_M or d // 4, d))
+    while d % m:
+        m -= 1
+    return m
+
+def choose_kind(n: int) -> str:
+    kind = FAISS_INDEX if FAISS_INDEX in KINDS else "auto"
+    if kind == "auto":
+        if n >= FAISS_IVF_MIN_VECTORS:
+            kind = "ivf_pq"
+        elif n >= FAISS_HNSW_MIN_VECTORS:
+            kind = "hnsw"
+        else:
+            kind = "flat"
+    # PQ8 codebooks have 256 centroids per sub-quantizer; short of that, scalar-quantize the lists
+    if kind == "ivf_pq" and n < 256 * MIN_TRAIN_PER_LIST:
+        kind = "ivf_sq"
+    # too few vectors to train the coarse quantizer (or SQ8's ranges, for HNSW): stay exact
+    if kind != "flat" and n < max(256, 16 * MIN_TRAIN_PER_LIST):
+        return "flat"
+    return kind
+
+def factory_spec(kind: str, n: int, d: int) -> str:
+    if kind == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}_SQ8"
+    if kind == "ivf_sq":
+        return f"IVF{_nlist(n)},SQ8"
+    if kind == "ivf_pq":
+        return f"IVF{_nlist(n)},PQ{_pq_m(d)}"
+    return "Flat"
+
+def tune(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    # query-time knobs; no-ops for index types that do not have them
+    import faiss
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else faiss.downcast_index(index)
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = ef_search or FAISS_EF_SEARCH
+    try:
+        faiss.extract_index_ivf(inner).nprobe = nprobe or FAISS_NPROBE
+    except RuntimeError:
+        pass
+    return index
+
+def build(kind: str, vectors: np.ndarray, labels: np.ndarray, spec: Optional[str] = None):
+    import faiss
+    n, d = vectors.shape
+    spec = spec or factory_spec(kind, n, d)
+    inner = faiss.index_factory(d, spec, faiss.METRIC_INNER_PRODUCT)
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+    if not inner.is_trained:
+        # train on a random sample; at least MIN_TRAIN_PER_LIST points per IVF list when available
+        want = FAISS_TRAIN_SAMPLE
+        if spec.startswith("IVF"):
+            want = max(want, _nlist(n) * MIN_TRAIN_PER_LIST)
+        rng = np.random.default_rng(0)
+        sample = vectors if n <= want else vectors[np.sort(rng.choice(n, want, replace=False))]
+        inner.train(np.ascontiguousarray(sample, dtype="float32"))
+    index = faiss.IndexIDMap2(inner)
+    if n:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), labels.astype("int64"))
+    return tune(index)
+
+def vectors_of(index) -> Tuple[np.ndarray, np.ndarray]:
+    # (labels, vectors) in insertion order; exact for flat, decoded approximations otherwise
+    import faiss
+    inner = faiss.downcast_index(index.index)
+    try:
+        faiss.extract_index_ivf(inner).make_direct_map()
+    except RuntimeError:
+        pass
+    labels = faiss.vector_to_array(index.id_map).astype("int64")
+    vectors = inner.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype="float32")
+    return labels, vectors
+
+def bytes_per_vector(index) -> float:
+    import faiss
+    return len(faiss.serialize_index(index)) / max(index.ntotal, 1)
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, kinds: Sequence[str] = ("hnsw", "ivf_sq", "ivf_pq"),
+                  nprobes: Sequence[int] = (1, 4, 16, 64), ef_searches: Sequence[int] = (16, 32, 64, 128)) -> List[Dict[str, Any]]:
+    # recall@k of each layout against the exact flat scan, with per-query latency and memory per vector
+    labels = np.arange(len(vectors), dtype="int64")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+
+    def measure(index):
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k)
+        return found, (time.perf_counter() - t0) * 1000 / len(queries)
+
+    t0 = time.perf_counter()
+    flat = build("flat", vectors, labels)
+    truth, flat_ms = measure(flat)
+    rows = [{"kind": "flat", "spec": "Flat", "param": None, "recall": 1.0, "query_ms": round(flat_ms, 4),
+             "build_s": round(time.perf_counter() - t0, 3), "bytes_per_vector": round(bytes_per_vector(flat), 1)}]
+    for kind in kinds:
+        t0 = time.perf_counter()
+        index = build(kind, vectors, labels)
+        build_s = time.perf_counter() - t0
+        size = bytes_per_vector(index)
+        params = [("ef_search", v) for v in ef_searches] if kind == "hnsw" else [("nprobe", v) for v in nprobes]
+        for name, value in params:
+            tune(index, **{name: value})
+            found, ms = measure(index)
+            hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+            rows.append({"kind": kind, "spec": factory_spec(kind, len(vectors), vectors.shape[1]), "param": {name: value},
+                         "recall": round(hits / truth.size, 4), "query_ms": round(ms, 4), "build_s": round(build_s, 3),
+                         "bytes_per_vector": round(size, 1)})
+    return rows
@@ -0,0 +1,188 @@
+
+import os, re, json, time, hashlib, threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from .config import (ANSWER_CACHE_DIR, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL,
+                     ANSWER_CACHE_SIM_THRESHOLD, ANSWER_CACHE_FLUSH_SECONDS)
+
+# LLM answers keyed by (scope, normalized question, retrieved context ids), where scope is the
+# set of document shards + embedder + chat model. A question that misses exactly can still hit
+# an entry of the same scope whose question embedding is within ANSWER_CACHE_SIM_THRESHOLD.
+# On disk: answers.json (entries in LRU order) + vectors.npy (one question vector per entry).
+
+def normalize_question(q: str) -> str:
+    return re.sub(r"\s+", " ", q).strip().lower().rstrip(" ?.!")
+
+def context_key(contexts: List[Dict[str, Any]]) -> str:
+    ids = sorted(str(c["id"]) for c in contexts)
+    return hashlib.blake2b("\n".join(ids).encode("utf-8"), digest_size=8).hexdigest()
+
+def _entry_key(scope: str, question: str, ctx: str) -> str:
+    return hashlib.blake2b(f"{scope}\x00{question}\x00{ctx}".encode("utf-8"), digest_size=16).hexdigest()
+
+class AnswerCache:
+    def __init__(self, root: str, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 sim_threshold: float = ANSWER_CACHE_SIM_THRESHOLD):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sim_threshold = sim_threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_scope: Dict[str, set] = {}
+        self._dirty = False
+        self._flushed = 0.0
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _load(self):
+        try:
+            with open(self._path("answers.json"), "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            vectors = np.load(self._path("vectors.npy"))
+        except Exception:
+            return
+        if len(raw) != len(vectors):
+            return
+        now = time.time()
+        for e, v in zip(raw, vectors):
+            if now - e["created"] <= self.ttl:
+                e["vector"] = v
+                self._insert(e)
+
+    def _insert(self, e: Dict[str, Any]):
+        self._entries[e["key"]] = e
+        self._by_scope.setdefault(e["scope"], set()).add(e["key"])
+
+    def _drop(self, key: str):
+        e = self._entries.pop(key)
+        keys = self._by_scope.get(e["scope"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_scope[e["scope"]]
+
+    def _live(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        e = self._entries.get(key)
+        if e is None:
+            return None
+        if now - e["created"] > self.ttl:
+            self._drop(key)
+            self.stats["expired"] += 1
+            self._dirty = True
+            return None
+        return e
+
+    def _nearest(self, scope: str, vector: np.ndarray, now: float) -> Optional[Dict[str, Any]]:
+        keys = [k for k in self._by_scope.get(scope, ()) if self._live(k, now) is not None]
+        if not keys or self.sim_threshold > 1.0:
+            return None
+        mat = np.stack([self._entries[k]["vector"] for k in keys])
+        sims = mat @ vector
+        best = int(np.argmax(sims))
+        return self._entries[keys[best]] if sims[best] >= self.sim_threshold else None
+
+    def get_many(self, scope: str, questions: List[str], contexts_list: List[List[Dict[str, Any]]],
+                 qvecs: Optional[np.ndarray]) -> List[Optional[Tuple[Dict[str, Any], str]]]:
+        # (answer, "exact" | "semantic") per question, None on a miss
+        out: List[Optional[Tuple[Dict[str, Any], str]]] = []
+        now = time.time()
+        with self._lock:
+            for i, (q, contexts) in enumerate(zip(questions, contexts_list)):
+                e = self._live(_entry_key(scope, normalize_question(q), context_key(contexts)), now)
+                kind = "exact"
+                if e is None and qvecs is not None:
+                    e = self._nearest(scope, _unit(qvecs[i]), now)
+                    kind = "semantic"
+                if e is None:
+                    self.stats["misses"] += 1
+                    out.append(None)
+                    continue
+                self._entries.move_to_end(e["key"])
+                self.stats[f"{kind}_hits"] += 1
+                out.append((dict(e["answer"]), kind))
+        return out
+
+    def put_many(self, scope: str, questions: List[str], contexts_list: List[List[Dict[str, Any]]],
+                 qvecs: Optional[np.ndarray], answers: List[Dict[str, Any]]):
+        if qvecs is None:
+            return
+        now = time.time()
+        with self._lock:
+            for i, (q, contexts, ans) in enumerate(zip(questions, contexts_list, answers)):
+                if ans.get("error"):
+                    continue  # transient LLM failures are not answers
+                nq = normalize_question(q)
+                key = _entry_key(scope, nq, context_key(contexts))
+                if key in self._entries:
+                    self._drop(key)
+                self._insert({"key": key, "scope": scope, "question": nq, "created": now,
+                              "answer": dict(ans), "vector": _unit(qvecs[i])})
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+            self._dirty = True
+            if now - self._flushed >= ANSWER_CACHE_FLUSH_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        entries = list(self._entries.values())
+        raw = [{k: v for k, v in e.items() if k != "vector"} for e in entries]
+        vectors = np.stack([e["vector"] for e in entries]) if entries else np.zeros((0, 0), dtype="float32")
+        suffix = f"tmp.{os.getpid()}.{threading.get_ident()}"
+        tmp = self._path(f"vectors.{suffix}.npy")
+        np.save(tmp, vectors.astype("float32"))
+        os.replace(tmp, self._path("vectors.npy"))
+        tmp = self._path(f"answers.json.{suffix}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False)
+        os.replace(tmp, self._path("answers.json"))
+        self._dirty = False
+        self._flushed = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self.stats)
+            s["entries"] = len(self._entries)
+        lookups = s["exact_hits"] + s["semantic_hits"] + s["misses"]
+        s["hit_rate"] = round((s["exact_hits"] + s["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+def scope_for(content_hashes: List[str]) -> str:
+    from .config import OPENAI_API_KEY
+    from .embeddings import embedder_name
+    from .reasoner import OPENAI_CHAT_MODEL
+    chat = OPENAI_CHAT_MODEL if OPENAI_API_KEY else "heuristic"
+    return "|".join([",".join(sorted(set(content_hashes))), embedder_name(), chat])
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype="float32")
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            import atexit
+            _cache = AnswerCache(ANSWER_CACHE_DIR)
+            atexit.register(_cache.flush)
+        return _cache
+
+def answer_cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        return _cache.snapshot() if _cache is not None else {}
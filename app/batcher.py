@@ -0,0 +1,97 @@
+
+import time, queue, threading
+import numpy as np
+from concurrent.futures import Future
+from typing import List, Optional
+from .config import EMBED_BATCHING, EMBED_BATCH_MAX_WAIT_MS, EMBED_BATCH_MAX_SIZE
+from .embeddings import embed_texts, embed_texts_with_hits
+from .metrics import histogram, record
+
+BATCH_SIZE = histogram("embed_batch_size", [1, 2, 4, 8, 16, 32, 64, 128, 256],
+                       "Query texts per coalesced encode call")
+QUEUE_WAIT = histogram("embed_queue_wait_seconds", [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25],
+                       "Time a query embedding request waited for its batch")
+
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+# Coalesces embed requests from concurrent handlers: the worker takes the first waiting request,
+# keeps collecting for up to max_wait (or until max_batch texts) and runs one encode for all of them
+class EmbeddingBatcher:
+    def __init__(self, max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS, max_batch: int = EMBED_BATCH_MAX_SIZE):
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return embed_texts(texts)
+        self._ensure_worker()
+        req = _Request(list(texts))
+        self._queue.put(req)
+        vecs, found = req.future.result()
+        # the encode ran on the batcher thread, outside this request's metrics context
+        if found is not None:
+            hits = int(found.sum())
+            record("embedding_cache", hits=hits, misses=len(found) - hits)
+        return vecs
+
+    def _collect(self) -> List[_Request]:
+        first = self._queue.get()
+        batch, size = [first], len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = [t for req in batch for t in req.texts]
+            BATCH_SIZE.observe(len(texts))
+            for req in batch:
+                QUEUE_WAIT.observe(started - req.enqueued)
+            try:
+                vecs, found = embed_texts_with_hits(texts)
+            except BaseException as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            offset = 0
+            for req in batch:
+                part = slice(offset, offset + len(req.texts))
+                req.future.set_result((vecs[part], None if found is None else found[part]))
+                offset += len(req.texts)
+
+_batcher: Optional[EmbeddingBatcher] = None
+_batcher_lock = threading.Lock()
+
+def embed_queries(texts: List[str]) -> np.ndarray:
+    global _batcher
+    if not EMBED_BATCHING:
+        return embed_texts(texts)
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher()
+    return _batcher.embed(texts)
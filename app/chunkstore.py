@@ -0,0 +1,70 @@
+
+import bisect
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+# Row-addressed variable-length byte column: chunk text (UTF-8) and packed JSON metadata.
+# Each part is one UTF-8 blob plus an (n+1) offsets array; a compacted base's part is
+# memory-mapped straight from its .npy files, appended segments add small in-memory parts.
+# A row reads as a single slice of the blob, so lookups for the top-k hits touch only those
+# pages and nothing is decoded up front. Parts with blob None cover rows written before the
+# column existed (legacy stores) and read as missing.
+
+def pack(values: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(values) + 1, dtype="int64")
+    offsets[1:] = np.cumsum([len(v) for v in values])
+    blob = np.frombuffer(b"".join(values), dtype="uint8")
+    return blob, offsets
+
+def pack_texts(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    return pack([t.encode("utf-8") for t in texts])
+
+class BlobColumn:
+    def __init__(self, parts: Sequence[tuple] = ()):
+        # parts: (first_row, count, blob or None, offsets or None, present mask or None)
+        self.parts = list(parts)
+        self._starts = [p[0] for p in self.parts]
+        self.n = self.parts[-1][0] + self.parts[-1][1] if self.parts else 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    @classmethod
+    def of(cls, blob: Optional[np.ndarray], offsets: Optional[np.ndarray], count: int,
+           present: Optional[np.ndarray] = None) -> "BlobColumn":
+        return cls().extended(blob, offsets, count, present)
+
+    def extended(self, blob: Optional[np.ndarray], offsets: Optional[np.ndarray], count: int,
+                 present: Optional[np.ndarray] = None) -> "BlobColumn":
+        # columns are immutable so searchers can keep reading a snapshot while a writer appends
+        if not count:
+            return self
+        return BlobColumn(self.parts + [(self.n, count, blob, offsets, present)])
+
+    def get(self, row: int) -> Optional[bytes]:
+        i = bisect.bisect_right(self._starts, row) - 1
+        if i < 0 or row >= self.n:
+            return None
+        first, _, blob, offsets, present = self.parts[i]
+        r = row - first
+        if blob is None or (present is not None and not present[r]):
+            return None
+        return blob[offsets[r]:offsets[r + 1]].tobytes()
+
+    def text(self, row: int) -> Optional[str]:
+        raw = self.get(row)
+        return None if raw is None else raw.decode("utf-8")
+
+    def complete(self) -> bool:
+        return all(p[2] is not None and (p[4] is None or bool(p[4].all())) for p in self.parts)
+
+    def packed(self) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        # one contiguous (blob, offsets, present-or-None) for writing a new base generation
+        values: List[bytes] = []
+        present = np.ones(self.n, dtype="bool")
+        for row in range(self.n):
+            raw = self.get(row)
+            present[row] = raw is not None
+            values.append(raw or b"")
+        blob, offsets = pack(values)
+        return blob, offsets, (None if present.all() else present)
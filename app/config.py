@@ -14,20 +14,112 @@ ALLOWED_BEARER_TOKEN = os.getenv(
 
 # === OpenAI ===
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_EMBED_BATCH_TOKENS = int(os.getenv("OPENAI_EMBED_BATCH_TOKENS", "100000"))  # per embeddings request (API cap 300k)
+OPENAI_EMBED_MAX_INPUTS = int(os.getenv("OPENAI_EMBED_MAX_INPUTS", "2048"))        # per embeddings request (API cap)
 
 # === Pinecone ===
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENV = os.getenv("PINECONE_ENV", "us-west1-gcp")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX", "policy-index")
+PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")         # serverless spec when the index is created
+PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
+PINECONE_LOCAL = os.getenv("PINECONE_LOCAL", "false").lower() == "true"  # in-memory stand-in, no API key needed
+PINECONE_BATCH_SIZE = int(os.getenv("PINECONE_BATCH_SIZE", "100"))       # vectors per upsert request
+PINECONE_MAX_REQUEST_BYTES = int(os.getenv("PINECONE_MAX_REQUEST_BYTES", str(2 * 1024 * 1024)))  # per upsert request
+PINECONE_UPSERT_WORKERS = int(os.getenv("PINECONE_UPSERT_WORKERS", "4"))  # upsert requests in flight
+PINECONE_RETRIES = int(os.getenv("PINECONE_RETRIES", "3"))               # per batch, exponential backoff
 
 # === Storage ===
-STORAGE_DIR = os.getenv("STORAGE_DIR", "./storage")
-os.makedirs(STORAGE_DIR, exist_ok=True)
+STORAGE_DIR = os.getenv("STORAGE_DIR", "./storage")  # subdirectories are created on first use
+
+# === Vector Store Cache ===
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"  # open persisted indexes read-only mmap
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "8"))  # per-document shards searched in parallel
+FAISS_COMPACT_SEGMENTS = int(os.getenv("FAISS_COMPACT_SEGMENTS", "8"))  # fold appended segments into a new base
+STORE_CACHE_MAX_BYTES = int(os.getenv("STORE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# === ANN Index ===
+FAISS_INDEX = os.getenv("FAISS_INDEX", "auto")  # auto | flat | hnsw | ivf_sq | ivf_pq (per shard at compaction; shards are per document)
+FAISS_HNSW_MIN_VECTORS = int(os.getenv("FAISS_HNSW_MIN_VECTORS", "50000"))   # auto: flat below this
+FAISS_IVF_MIN_VECTORS = int(os.getenv("FAISS_IVF_MIN_VECTORS", "1000000"))   # auto: ivf_pq from here
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "0"))  # PQ sub-quantizers (bytes/vector); 0 = dim/4
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))  # vectors sampled to train IVF/PQ/SQ
+
+# === Document Fetch ===
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(100 * 1024 * 1024)))  # abort larger downloads (0 = no cap)
+FETCH_PER_HOST_CONNECTIONS = int(os.getenv("FETCH_PER_HOST_CONNECTIONS", "4"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "10"))
+
+# === Ingestion Pipeline ===
+DOC_SPOOL_MAX_BYTES = int(os.getenv("DOC_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))  # spill downloads to disk above this
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))     # chunks per embed + index step
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))  # processes for page extraction
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))  # smaller PDFs parse in-process
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))    # batches buffered between stages
+
+# === Ingest Jobs ===
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))            # documents fetched + ingested at once
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "64"))   # queued documents before POST /hackrx/ingest gets 429
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000")) # finished jobs kept for the status endpoint
+
+# === Query Embedding Batcher ===
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "true").lower() == "true"  # coalesce query embeds across requests
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+
+# === Embedding Cache ===
+EMB_CACHE_ENABLED = os.getenv("EMB_CACHE_ENABLED", "true").lower() == "true"
+EMB_CACHE_DIR = os.getenv("EMB_CACHE_DIR", os.path.join(STORAGE_DIR, "emb_cache"))
+EMB_CACHE_MAX_ROWS = int(os.getenv("EMB_CACHE_MAX_ROWS", "200000"))  # per embedder model
+EMB_CACHE_DTYPE = os.getenv("EMB_CACHE_DTYPE", "float16")           # float16 | float32
+
+# === Document Cache ===
+DOC_CACHE_ENABLED = os.getenv("DOC_CACHE_ENABLED", "true").lower() == "true"
+DOC_CACHE_DIR = os.getenv("DOC_CACHE_DIR", os.path.join(STORAGE_DIR, "doc_cache"))
+
+# === Answer Cache ===
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", os.path.join(STORAGE_DIR, "answer_cache"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))  # LRU beyond this
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))              # seconds
+ANSWER_CACHE_SIM_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIM_THRESHOLD", "0.95"))  # cosine for near-duplicate questions; >1 disables
+ANSWER_CACHE_FLUSH_SECONDS = float(os.getenv("ANSWER_CACHE_FLUSH_SECONDS", "5"))  # min gap between disk writes
 
 # === Retrieval Params ===
 TOP_K = int(os.getenv("TOP_K", "5"))
 SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.65"))
 MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "1200"))  # per chunk trim for token efficiency
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"  # merge/dedupe/MMR into a token budget
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # total context tokens per question
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = pure relevance, lower = more diverse
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"  # fuse per-document BM25 hits into dense search
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # dense and lexical hits per question fed to the fusion
+RRF_K = int(os.getenv("RRF_K", "60"))                          # reciprocal rank fusion damping
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+LEXICAL_CACHE_MAX = int(os.getenv("LEXICAL_CACHE_MAX", "256"))  # BM25 indexes kept loaded
+
+# === LLM Client ===
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))        # max in-flight chat completions
+LLM_REQUESTS_PER_MIN = int(os.getenv("LLM_REQUESTS_PER_MIN", "500"))
+LLM_TOKENS_PER_MIN = int(os.getenv("LLM_TOKENS_PER_MIN", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_BATCH_QUESTIONS = os.getenv("LLM_BATCH_QUESTIONS", "false").lower() == "true"  # answer overlapping questions in one call
+LLM_BATCH_MAX_QUESTIONS = int(os.getenv("LLM_BATCH_MAX_QUESTIONS", "8"))
+LLM_BATCH_MIN_OVERLAP = float(os.getenv("LLM_BATCH_MIN_OVERLAP", "0.5"))  # share of a question's chunks already in the group
+
+# === Startup ===
+WARMUP_EMBEDDER = os.getenv("WARMUP_EMBEDDER", "true").lower() == "true"  # load + run the embedder once at boot
+PRELOAD_INDEXES = [n.strip() for n in os.getenv("PRELOAD_INDEXES", "").split(",") if n.strip()]  # names, or "*"
+
+# === Metrics ===
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # stage timings, Server-Timing, /metrics
 
 # === Server ===
 API_PREFIX = "/api/v1"
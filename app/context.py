@@ -0,0 +1,105 @@
+
+import re
+from typing import List, Dict, Any, Optional
+from .config import CONTEXT_TOKEN_BUDGET, MMR_LAMBDA
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.;:!?])\s+")
+_encoder = None
+
+def count_tokens(text: str) -> int:
+    # tiktoken when installed; otherwise the usual ~4 chars/token estimate
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def _words(text: str) -> set:
+    return set(w.lower() for w in _WORD.findall(text))
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _mmr_order(hits: List[Dict[str, Any]], lam: float) -> List[Dict[str, Any]]:
+    # maximal marginal relevance with lexical (Jaccard) redundancy, so no chunk vectors are needed
+    remaining = list(hits)
+    bags = {id(h): _words(h["text"]) for h in hits}
+    picked: List[Dict[str, Any]] = []
+    while remaining:
+        def gain(h):
+            redundancy = max((_similarity(bags[id(h)], bags[id(p)]) for p in picked), default=0.0)
+            return lam * h["score"] - (1 - lam) * redundancy
+        best = max(remaining, key=gain)
+        picked.append(best)
+        remaining.remove(best)
+    return picked
+
+def _join_overlapping(a: str, b: str, max_overlap: int = 400) -> str:
+    # consecutive windows share a tail/head; keep it once
+    for k in range(min(len(a), len(b), max_overlap), 19, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return a + " " + b
+
+def _merge_runs(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # hits from the same document with consecutive chunk_index become one block
+    by_doc: Dict[Any, List[Dict[str, Any]]] = {}
+    for h in hits:
+        by_doc.setdefault(h["metadata"].get("doc_id"), []).append(h)
+    blocks = []
+    for doc_hits in by_doc.values():
+        doc_hits.sort(key=lambda h: h["metadata"].get("chunk_index", -1))
+        run = None
+        for h in doc_hits:
+            idx = h["metadata"].get("chunk_index")
+            if run is not None and idx is not None and idx - run["last_index"] <= 1:
+                if idx != run["last_index"]:
+                    run["text"] = _join_overlapping(run["text"], h["text"])
+                    run["ids"].append(h["id"])
+                run["score"] = max(run["score"], h["score"])
+                run["last_index"] = idx
+                continue
+            run = {"id": h["id"], "ids": [h["id"]], "score": h["score"], "text": h["text"],
+                   "metadata": dict(h["metadata"]), "last_index": idx}
+            blocks.append(run)
+    return blocks
+
+def _sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+def pack_contexts(hits: List[Dict[str, Any]], budget: Optional[int] = None, lam: float = MMR_LAMBDA) -> List[Dict[str, Any]]:
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if not hits:
+        return []
+    blocks = _mmr_order(_merge_runs(hits), lam)
+    seen = set()
+    used = 0
+    packed = []
+    for block in blocks:
+        kept = []
+        for sent in _sentences(block["text"]):
+            key = " ".join(sent.lower().split())
+            if key in seen:
+                continue  # same clause already packed from another chunk
+            cost = count_tokens(sent) + 1
+            if used + cost > budget:
+                break
+            seen.add(key)
+            kept.append(sent)
+            used += cost
+        if kept:
+            meta = block["metadata"]
+            if len(block["ids"]) > 1:
+                meta["merged_ids"] = block["ids"]
+            packed.append({"id": block["id"], "score": float(block["score"]), "text": " ".join(kept), "metadata": meta})
+        if used >= budget:
+            break
+    return packed
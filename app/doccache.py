@@ -0,0 +1,253 @@
+
+import os, json, shutil, threading, time
+import numpy as np
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from .config import DOC_CACHE_ENABLED, DOC_CACHE_DIR
+from .embeddings import embedder_name, model_slug
+from . import ingest
+from .pipeline import run_pipeline
+
+@dataclass
+class PreparedDocument:
+    url: str
+    content_hash: str
+    chunks: List[ingest.DocumentChunk]
+    vectors: np.ndarray
+    cache: str  # "hit" (content known), "revalidated" (304, no download) or "miss"
+    trace: Dict[str, Any] = field(default_factory=dict)
+    n_chunks: int = -1  # chunks/vectors stay on disk (doc cache + shard) unless there is no doc cache
+
+    def __post_init__(self):
+        if self.n_chunks < 0:
+            self.n_chunks = len(self.chunks)
+
+def _atomic_write(path: str, data: bytes):
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# Parsed chunks + vectors keyed by content hash, plus URL -> (hash, ETag, Last-Modified)
+class DocumentCache:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.urls_path = os.path.join(root, "urls.json")
+        self._lock = threading.Lock()
+        self._urls: Dict[str, Dict[str, str]] = {}
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+        if os.path.exists(self.urls_path):
+            try:
+                with open(self.urls_path, "r", encoding="utf-8") as f:
+                    self._urls = json.load(f)
+            except Exception:
+                self._urls = {}
+
+    def _chunks_path(self, h: str) -> str:
+        return os.path.join(self.root, f"{h}.chunks.json")
+
+    def _vectors_path(self, h: str, model: Optional[str] = None) -> str:
+        # vectors depend on the model that produced them, chunks do not
+        return os.path.join(self.root, f"{h}.{model_slug(model)}.npy")
+
+    def lookup_url(self, url: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            return self._urls.get(url)
+
+    def remember_url(self, url: str, content_hash: str, etag: str, last_modified: str):
+        with self._lock:
+            self._urls[url] = {"content_hash": content_hash, "etag": etag, "last_modified": last_modified}
+            _atomic_write(self.urls_path, json.dumps(self._urls, ensure_ascii=False).encode("utf-8"))
+
+    def has(self, h: str, model: Optional[str] = None) -> bool:
+        return os.path.exists(self._chunks_path(h)) and os.path.exists(self._vectors_path(h, model))
+
+    def count(self, h: str, model: Optional[str] = None) -> int:
+        # chunk count from the .npy header alone; 0 when the entry is missing
+        try:
+            return int(np.load(self._vectors_path(h, model), mmap_mode="r").shape[0])
+        except Exception:
+            return 0
+
+    def load_chunks(self, h: str) -> Optional[List[ingest.DocumentChunk]]:
+        try:
+            with open(self._chunks_path(h), "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception:
+            return None
+        return [ingest.DocumentChunk(id=c["id"], text=c["text"], metadata=c["metadata"]) for c in raw]
+
+    def load(self, h: str, model: Optional[str] = None) -> Optional[Tuple[List[ingest.DocumentChunk], np.ndarray]]:
+        vpath = self._vectors_path(h, model)
+        if not os.path.exists(vpath):
+            return None
+        chunks = self.load_chunks(h)
+        try:
+            vectors = np.load(vpath)
+        except Exception:
+            return None
+        if chunks is None or len(chunks) != len(vectors):
+            return None
+        return chunks, vectors
+
+    def writer(self, h: str, model: Optional[str] = None) -> "CacheWriter":
+        return CacheWriter(self._chunks_path(h), self._vectors_path(h, model))
+
+    def record(self, status: str):
+        key = {"hit": "hits", "revalidated": "revalidated", "miss": "misses"}[status]
+        with self._lock:
+            self.stats[key] += 1
+
+# Streams one document's chunks and vectors to temp files batch by batch; commit() publishes both
+class CacheWriter:
+    def __init__(self, chunks_path: str, vectors_path: str):
+        self.chunks_path, self.vectors_path = chunks_path, vectors_path
+        suffix = f".tmp.{os.getpid()}.{threading.get_ident()}"
+        self._ctmp, self._vtmp = chunks_path + suffix, vectors_path + suffix
+        self._chunks = open(self._ctmp, "w", encoding="utf-8")
+        self._chunks.write("[")
+        self._vectors = open(self._vtmp, "wb")
+        self.count, self.dim = 0, 0
+
+    def add(self, chunks: List[ingest.DocumentChunk], vectors: np.ndarray):
+        for c in chunks:
+            self._chunks.write(("," if self.count else "") + json.dumps({"id": c.id, "text": c.text, "metadata": c.metadata}, ensure_ascii=False))
+            self.count += 1
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        self.dim = vectors.shape[1]
+        self._vectors.write(vectors.tobytes())
+
+    def commit(self):
+        self._chunks.write("]")
+        self._chunks.close()
+        self._vectors.close()
+        if not self.count:
+            self.discard()
+            return
+        # an .npy is a header plus the raw rows; the header needs the final shape, so it goes in last
+        tmp = f"{self._vtmp}.npy"
+        with open(tmp, "wb") as out, open(self._vtmp, "rb") as raw:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype("float32")), "fortran_order": False,
+                      "shape": (self.count, self.dim)}
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 20)
+        os.remove(self._vtmp)
+        os.replace(self._ctmp, self.chunks_path)
+        os.replace(tmp, self.vectors_path)
+
+    def discard(self):
+        self._chunks.close()
+        self._vectors.close()
+        for path in (self._ctmp, self._vtmp):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+_cache: Optional[DocumentCache] = None
+
+def get_doc_cache() -> DocumentCache:
+    global _cache
+    if _cache is None:
+        _cache = DocumentCache(DOC_CACHE_DIR)
+    return _cache
+
+def cache_stats() -> Dict[str, int]:
+    return dict(get_doc_cache().stats) if DOC_CACHE_ENABLED else {}
+
+@dataclass
+class FetchedDocument:
+    url: str
+    content_hash: str
+    fetch: Optional[ingest.FetchResult]  # None when the cached copy was reused without a body
+    cache: str
+    trace: Dict[str, Any] = field(default_factory=dict)
+
+def fetch(url: str) -> FetchedDocument:
+    if not DOC_CACHE_ENABLED:
+        res = ingest.fetch_document_conditional(url)
+        return FetchedDocument(url, res.content_hash, res, "miss", {"fetch": res.trace})
+
+    cache = get_doc_cache()
+    known = cache.lookup_url(url)
+    if known and cache.has(known["content_hash"]):
+        res = ingest.fetch_document_conditional(url, known.get("etag", ""), known.get("last_modified", ""))
+        if res.not_modified:
+            return FetchedDocument(url, known["content_hash"], None, "revalidated", {"fetch": res.trace})
+    else:
+        res = ingest.fetch_document_conditional(url)
+
+    h = res.content_hash
+    cache.remember_url(url, h, res.etag, res.last_modified)
+    if cache.has(h):
+        res.spool.close()
+        return FetchedDocument(url, h, None, "hit", {"fetch": res.trace})
+    return FetchedDocument(url, h, res, "miss", {"fetch": res.trace})
+
+def materialize(doc: FetchedDocument, on_batch: Optional[Callable[[List[ingest.DocumentChunk], np.ndarray], None]] = None,
+                resident: Optional[Callable[[int], bool]] = None, model: Optional[str] = None) -> PreparedDocument:
+    # resident(n): the caller's index already holds all n cached chunks, text included;
+    # model: the embedder the caller's shard is keyed by (vectors are cached under it too)
+    model = model or embedder_name()
+    if doc.fetch is None:
+        n = get_doc_cache().count(doc.content_hash, model)
+        if n and resident is not None and resident(n):
+            # warm request: nothing to index, so chunks.json and the vectors are never read
+            get_doc_cache().record(doc.cache)
+            return PreparedDocument(doc.url, doc.content_hash, [], np.zeros((0, 0), dtype="float32"),
+                                    doc.cache, doc.trace, n_chunks=n)
+        cached = get_doc_cache().load(doc.content_hash, model)
+        if cached is not None:
+            get_doc_cache().record(doc.cache)
+            if on_batch is not None and cached[0]:
+                on_batch(cached[0], cached[1])
+            return PreparedDocument(doc.url, doc.content_hash, cached[0], cached[1], doc.cache, doc.trace)
+        # cache entry vanished between fetch and load; download again
+        res = ingest.fetch_document_conditional(doc.url)
+        doc = FetchedDocument(doc.url, res.content_hash, res, "miss", {"fetch": res.trace})
+
+    t0 = time.perf_counter()
+    # batches are written to the cache as they arrive and then dropped; only without a cache do
+    # the chunks stay in memory (stores without a text column need them to answer)
+    writer = get_doc_cache().writer(doc.content_hash, model) if DOC_CACHE_ENABLED else None
+    kept: List[ingest.DocumentChunk] = []
+
+    def sink(batch, vectors):
+        if on_batch is not None:
+            on_batch(batch, vectors)
+        if writer is not None:
+            writer.add(batch, vectors)
+        else:
+            kept.extend(batch)
+    try:
+        chunks = ingest.iter_chunks(ingest.iter_pages(doc.fetch), doc.content_hash, doc.url)
+        n = run_pipeline(chunks, sink, model=model)
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    finally:
+        doc.fetch.spool.close()
+    if writer is not None:
+        writer.commit()
+        get_doc_cache().record("miss")
+    trace = dict(doc.trace, ingest_ms=round((time.perf_counter() - t0) * 1000, 1))
+    return PreparedDocument(doc.url, doc.content_hash, kept, np.zeros((0, 0), dtype="float32"), "miss", trace, n_chunks=n)
+
+def chunk_texts(hashes: List[str], loaded: List[PreparedDocument] = ()) -> Dict[str, str]:
+    # chunk id -> text for stores without a text column (Pinecone, older shards); chunks a
+    # document still holds are used as-is, the rest are read back from the cache
+    out: Dict[str, str] = {}
+    held = set()
+    for d in loaded:
+        if d.chunks:
+            out.update((ch.id, ch.text) for ch in d.chunks)
+            held.add(d.content_hash)
+    for h in dict.fromkeys(hashes):
+        if h not in held:
+            out.update((ch.id, ch.text) for ch in (get_doc_cache().load_chunks(h) or []))
+    return out
+
+def prepare_document(url: str, on_batch: Optional[Callable[[List[ingest.DocumentChunk], np.ndarray], None]] = None) -> PreparedDocument:
+    return materialize(fetch(url), on_batch)
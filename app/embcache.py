@@ -0,0 +1,171 @@
+
+import os, re, json, hashlib, threading
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from .config import EMB_CACHE_DIR, EMB_CACHE_MAX_ROWS, EMB_CACHE_DTYPE
+
+# Fixed-capacity on-disk ring of embeddings for one model:
+#   header.json  {"dim", "dtype", "capacity"}
+#   keys.bin     capacity x 16-byte text hashes (row -> key, all-zero = empty), memory-mapped
+#   vectors.bin  capacity x dim matrix in float16/float32, memory-mapped
+#   hand.bin     CLOCK hand shared by every process
+# A row is trusted only if keys.bin still holds the expected key before and after its vector
+# is copied; writers clear the key, write the vector, then write the key, so another worker
+# recycling a slot shows up as a miss, never as a wrong vector.
+
+KEY_BYTES = 16
+
+def text_key(text: str) -> bytes:
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+class EmbeddingCache:
+    def __init__(self, root: str, capacity: int = EMB_CACHE_MAX_ROWS, dtype: str = EMB_CACHE_DTYPE):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.capacity = capacity
+        self.dtype = dtype
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._ref: Optional[np.ndarray] = None
+        self._keys = self._vectors = self._hand = None
+        self._seen_hand = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._open_existing()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _open_existing(self):
+        header = self._path("header.json")
+        if not os.path.exists(header):
+            return
+        with open(header, "r", encoding="utf-8") as f:
+            h = json.load(f)
+        self._map(h["dim"], h["dtype"], h["capacity"], create=False)
+
+    def _map(self, dim: int, dtype: str, capacity: int, create: bool):
+        mode = "w+" if create else "r+"
+        self.dim, self.dtype, self.capacity = dim, dtype, capacity
+        self._keys = np.memmap(self._path("keys.bin"), dtype="uint8", mode=mode, shape=(capacity, KEY_BYTES))
+        self._vectors = np.memmap(self._path("vectors.bin"), dtype=dtype, mode=mode, shape=(capacity, dim))
+        self._hand = np.memmap(self._path("hand.bin"), dtype="int64", mode=mode, shape=(1,))
+        self._ref = np.zeros(capacity, dtype="uint8")
+        raw = np.asarray(self._keys).tobytes()
+        self._rows = {raw[i * KEY_BYTES:(i + 1) * KEY_BYTES]: int(i) for i in np.flatnonzero(self._keys.any(axis=1))}
+        self._seen_hand = int(self._hand[0])
+
+    def _catch_up(self):
+        # puts fill the ring from the shared hand onward, so the rows other workers wrote since
+        # we last looked are exactly [seen hand, hand); only those get rescanned
+        hand = int(self._hand[0])
+        if hand == self._seen_hand:
+            return
+        if hand > self._seen_hand:
+            rows = np.arange(self._seen_hand, hand)
+        else:
+            rows = np.concatenate([np.arange(self._seen_hand, self.capacity), np.arange(0, hand)])
+        block = np.asarray(self._keys[rows])
+        raw = block.tobytes()
+        for j in np.flatnonzero(block.any(axis=1)):
+            self._rows[raw[j * KEY_BYTES:(j + 1) * KEY_BYTES]] = int(rows[j])
+        self._seen_hand = hand
+
+    @contextmanager
+    def _file_lock(self):
+        import fcntl
+        with open(self._path("lock"), "a+") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def get_many(self, keys: List[bytes]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        found = np.zeros(len(keys), dtype=bool)
+        if self.dim is None:
+            with self._lock:
+                self._open_existing()  # another worker may have created it since
+        if self.dim is None:
+            with self._lock:
+                self.stats["misses"] += len(keys)
+            return None, found
+        out = np.zeros((len(keys), self.dim), dtype="float32")
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._catch_up()  # entries written by other workers
+            for i, k in enumerate(keys):
+                row = self._rows.get(k)
+                if row is None:
+                    continue
+                if self._keys[row].tobytes() != k:
+                    del self._rows[k]  # slot recycled by another process
+                    continue
+                out[i] = self._vectors[row]
+                if self._keys[row].tobytes() != k:
+                    # recycled while we copied: the vector may be half-written
+                    out[i] = 0
+                    self._rows.pop(k, None)
+                    continue
+                self._ref[row] = 1
+                found[i] = True
+            hits = int(found.sum())
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        return out, found
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        if not keys:
+            return
+        with self._lock, self._file_lock():
+            if self.dim is None:
+                if os.path.exists(self._path("header.json")):
+                    self._open_existing()
+                else:
+                    self._map(int(vectors.shape[1]), self.dtype, self.capacity, create=True)
+                    tmp = self._path(f"header.json.tmp.{os.getpid()}")
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump({"dim": self.dim, "dtype": self.dtype, "capacity": self.capacity}, f)
+                    os.replace(tmp, self._path("header.json"))
+            if vectors.shape[1] != self.dim:
+                return
+            self._catch_up()
+            hand = int(self._hand[0])
+            for k, v in zip(keys, vectors):
+                row = self._rows.get(k)
+                if row is not None and self._keys[row].tobytes() == k:
+                    continue
+                # CLOCK: give recently hit rows a second chance before recycling them
+                while self._ref[hand]:
+                    self._ref[hand] = 0
+                    hand = (hand + 1) % self.capacity
+                if self._keys[hand].any():
+                    self._rows.pop(self._keys[hand].tobytes(), None)
+                    self.stats["evictions"] += 1
+                # readers copy without the file lock: clear the key, write the vector, then the key
+                self._keys[hand] = 0
+                self._vectors[hand] = v
+                self._keys[hand] = np.frombuffer(k, dtype="uint8")
+                self._rows[k] = hand
+                hand = (hand + 1) % self.capacity
+            self._hand[0] = self._seen_hand = hand
+            self._vectors.flush()
+            self._keys.flush()
+            self._hand.flush()
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model: str) -> EmbeddingCache:
+    with _caches_lock:
+        cache = _caches.get(model)
+        if cache is None:
+            slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+            cache = _caches[model] = EmbeddingCache(os.path.join(EMB_CACHE_DIR, slug))
+        return cache
+
+def embedding_cache_stats() -> Dict[str, Dict[str, int]]:
+    with _caches_lock:
+        return {m: dict(c.stats) for m, c in _caches.items()}
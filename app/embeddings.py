@@ -1,16 +1,25 @@
 
+import re, threading
 import numpy as np
-from typing import List
-from .config import EMBEDDER, OPENAI_API_KEY
+from typing import List, Optional, Tuple
+from .config import EMBEDDER, OPENAI_API_KEY, EMB_CACHE_ENABLED, OPENAI_EMBED_BATCH_TOKENS, OPENAI_EMBED_MAX_INPUTS
+from .metrics import record
+
+SENTENCE_MODEL = "all-MiniLM-L6-v2"
+OPENAI_EMBED_MODEL = "text-embedding-3-small"
 
 _sentence_model = None
+_sentence_lock = threading.Lock()
 _openai_ready = None
 
 def _ensure_sentence_model():
     global _sentence_model
     if _sentence_model is None:
-        from sentence_transformers import SentenceTransformer
-        _sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # concurrent cold requests must not each load the model
+        with _sentence_lock:
+            if _sentence_model is None:
+                from sentence_transformers import SentenceTransformer
+                _sentence_model = SentenceTransformer(SENTENCE_MODEL)
     return _sentence_model
 
 def _ensure_openai():
@@ -19,23 +28,121 @@ def _ensure_openai():
         _openai_ready = bool(OPENAI_API_KEY)
     return _openai_ready
 
-def embed_texts(texts: List[str]) -> np.ndarray:
+def _openai_model() -> str:
+    # the pre-1.0 SDK has no OpenAI client class; _embed_uncached can only reach ada-002 through it
+    try:
+        from openai import OpenAI  # noqa: F401
+        return OPENAI_EMBED_MODEL
+    except ImportError:
+        return "text-embedding-ada-002"
+
+def embedder_name() -> str:
+    # the model that actually produces vectors; doc-cache files, shards and the embedding cache are keyed by it
+    if EMBEDDER == "openai" and _ensure_openai():
+        return f"openai:{_openai_model()}"
+    return f"sentence:{SENTENCE_MODEL}"
+
+def model_slug(model: Optional[str] = None) -> str:
+    # file- and namespace-safe form of a model name
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", model or embedder_name())
+
+class EmbedderMismatch(RuntimeError):
+    # a batch came back from a fallback model; its vectors must not land next to the primary's
+    pass
+
+OPENAI_EMBED_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+def embedding_dim() -> int:
+    # vector width of the active embedder (sizes external indexes such as Pinecone)
+    name = embedder_name()
+    if name.startswith("openai:"):
+        return OPENAI_EMBED_DIMS[name.split(":", 1)[1]]
+    return int(_ensure_sentence_model().get_sentence_embedding_dimension())
+
+def token_batches(texts: List[str], max_tokens: int = OPENAI_EMBED_BATCH_TOKENS,
+                  max_items: int = OPENAI_EMBED_MAX_INPUTS) -> List[List[int]]:
+    # index groups that keep each embeddings request under the API's token and input caps
+    from .context import count_tokens
+    out, cur, used = [], [], 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t)
+        if cur and (used + n > max_tokens or len(cur) >= max_items):
+            out.append(cur)
+            cur, used = [], 0
+        cur.append(i)
+        used += n
+    if cur:
+        out.append(cur)
+    return out
+
+def _embed_uncached(texts: List[str]) -> Tuple[np.ndarray, str]:
+    # returns the vectors and the model that actually produced them
     if EMBEDDER == "openai" and _ensure_openai():
         try:
             from openai import OpenAI
             client = OpenAI(api_key=OPENAI_API_KEY)
-            resp = client.embeddings.create(model="text-embedding-3-small", input=texts)
-            vecs = [d.embedding for d in resp.data]
-            return np.array(vecs, dtype="float32")
+            vecs = []
+            for group in token_batches(texts):
+                resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=[texts[i] for i in group])
+                vecs.extend(d.embedding for d in resp.data)
+            return np.array(vecs, dtype="float32"), f"openai:{OPENAI_EMBED_MODEL}"
         except Exception:
             import openai
             openai.api_key = OPENAI_API_KEY
             resp = openai.Embedding.create(model="text-embedding-ada-002", input=texts)
             vecs = [d["embedding"] for d in resp["data"]]
-            return np.array(vecs, dtype="float32")
+            return np.array(vecs, dtype="float32"), "openai:text-embedding-ada-002"
     model = _ensure_sentence_model()
     vecs = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-    return vecs.astype("float32")
+    return vecs.astype("float32"), f"sentence:{SENTENCE_MODEL}"
+
+def embed_texts(texts: List[str], model: Optional[str] = None) -> np.ndarray:
+    vecs, found = embed_texts_with_hits(texts, model)
+    if found is not None:
+        hits = int(found.sum())
+        record("embedding_cache", hits=hits, misses=len(found) - hits)
+    return vecs
+
+def _check_model(used: str, model: str):
+    if used != model:
+        raise EmbedderMismatch(f"embedder fell back to {used}; vectors would not match the {model} index")
+
+def embed_texts_with_hits(texts: List[str], model: Optional[str] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    # (vectors, per-text cache hit mask or None when the cache is off); recording the counts is
+    # left to the caller so the batcher thread can hand them back to each request's context.
+    # Every vector comes from `model` (default: the active embedder) or EmbedderMismatch is raised.
+    model = model or embedder_name()
+    if not EMB_CACHE_ENABLED or not texts:
+        vecs, used = _embed_uncached(texts)
+        if texts:
+            _check_model(used, model)
+        return vecs, None
+    from .embcache import get_embedding_cache, text_key
+    cache = get_embedding_cache(model)
+    keys = [text_key(t) for t in texts]
+    cached, found = cache.get_many(keys)
+    if found.all():
+        return cached, found
+
+    # embed each distinct missing text once, in a single batch
+    first = {}
+    for i, k in enumerate(keys):
+        if not found[i] and k not in first:
+            first[k] = i
+    miss_keys = list(first)
+    vecs, used = _embed_uncached([texts[first[k]] for k in miss_keys])
+    _check_model(used, model)
+    cache.put_many(miss_keys, vecs)
+    out = cached if cached is not None else np.zeros((len(texts), vecs.shape[1]), dtype="float32")
+    row_of = {k: j for j, k in enumerate(miss_keys)}
+    for i in np.flatnonzero(~found):
+        out[i] = vecs[row_of[keys[i]]]
+    return out, found
+
+def warm_up(batch_size: int = 8):
+    # bypasses the embedding cache so the model and its kernels are actually exercised
+    if embedder_name().startswith("sentence:"):
+        _embed_uncached(["warmup"] * batch_size)
 
 def embed_query(text: str) -> np.ndarray:
     return embed_texts([text])[0]
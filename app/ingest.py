@@ -1,9 +1,36 @@
 
-import os, re, hashlib, io, mimetypes, requests
-from typing import List, Dict, Any, Tuple
-from dataclasses import dataclass
+import os, re, hashlib, io, mimetypes, tempfile, threading, time, requests
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Optional, Union
+from dataclasses import dataclass, field
+from .config import (STORAGE_DIR, DOC_SPOOL_MAX_BYTES, FETCH_MAX_BYTES, FETCH_PER_HOST_CONNECTIONS,
+                     FETCH_RETRIES, FETCH_CONNECT_TIMEOUT, PDF_WORKERS, PDF_PARALLEL_MIN_PAGES)
+from .metrics import record
 
 DOC_TIMEOUT = 45
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+class DocumentTooLarge(ValueError):
+    pass
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    # one pooled session for all downloads; pool_block caps concurrent connections per host
+    global _session
+    with _session_lock:
+        if _session is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(total=FETCH_RETRIES, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET"], respect_retry_after_header=True, raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=FETCH_PER_HOST_CONNECTIONS,
+                                  pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
 
 @dataclass
 class DocumentChunk:
@@ -11,9 +38,78 @@ class DocumentChunk:
     text: str
     metadata: Dict[str, Any]
 
+# Download buffer: stays in memory up to max_size, then spills to a named temp file that
+# PyMuPDF can open by path, so large documents never sit fully in RAM
+class SpooledDownload:
+    def __init__(self, max_size: int = DOC_SPOOL_MAX_BYTES):
+        self.max_size = max_size
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buf: Optional[io.BytesIO] = io.BytesIO()
+        self._file = None
+        self._sha = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self._sha.update(data)
+        if self._file is None and self.size + len(data) > self.max_size:
+            tmp_dir = os.path.join(STORAGE_DIR, "tmp")
+            os.makedirs(tmp_dir, exist_ok=True)
+            self._file = tempfile.NamedTemporaryFile(prefix="doc_", dir=tmp_dir, delete=False)
+            self.path = self._file.name
+            self._file.write(self._buf.getvalue())
+            self._buf = None
+        (self._file or self._buf).write(data)
+        self.size += len(data)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def content_hash(self) -> str:
+        return self._sha.hexdigest()[:16]
+
+    def getvalue(self) -> bytes:
+        if self.path:
+            with open(self.path, "rb") as f:
+                return f.read()
+        return self._buf.getvalue() if self._buf is not None else b""
+
+    def close(self):
+        self.finish()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path, self._buf = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+@dataclass
+class FetchResult:
+    spool: Optional[SpooledDownload]
+    ext: str
+    etag: str = ""
+    last_modified: str = ""
+    not_modified: bool = False
+    trace: Dict[str, Any] = field(default_factory=dict)  # status, bytes, retries, timings
+
+    @property
+    def data(self) -> bytes:
+        return self.spool.getvalue() if self.spool is not None else b""
+
+    @property
+    def content_hash(self) -> str:
+        return self.spool.content_hash if self.spool is not None else ""
+
 def _hash(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()[:10]
 
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
 def _safe_text(txt: str) -> str:
     return re.sub(r'\s+', ' ', txt).strip()
 
@@ -23,26 +119,135 @@ def _guess_ext_from_ct(content_type: str) -> str:
     ext = mimetypes.guess_extension(content_type.split(";")[0].strip())
     return ext or ""
 
+def fetch_document_conditional(url: str, etag: str = "", last_modified: str = "") -> FetchResult:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    t0 = time.perf_counter()
+    with get_session().get(url, headers=headers, timeout=(FETCH_CONNECT_TIMEOUT, DOC_TIMEOUT), stream=True) as r:
+        retries = r.raw.retries
+        trace = {
+            "status": r.status_code,
+            "retries": len(retries.history) if retries is not None else 0,
+            "conditional": bool(headers),
+            "ttfb_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+        if r.status_code == 304:
+            trace.update(bytes=0, total_ms=trace["ttfb_ms"])
+            record("fetch", trace["total_ms"] / 1000, not_modified=1)
+            return FetchResult(None, "", etag, last_modified, not_modified=True, trace=trace)
+        r.raise_for_status()
+        declared = int(r.headers.get("Content-Length") or 0)
+        if FETCH_MAX_BYTES and declared > FETCH_MAX_BYTES:
+            raise DocumentTooLarge(f"{url} is {declared} bytes; limit is {FETCH_MAX_BYTES}")
+        content_type = r.headers.get("Content-Type", "")
+        ext = _guess_ext_from_ct(content_type)
+        if not ext:
+            url_path = url.split("?")[0]
+            ext = os.path.splitext(url_path)[1].lower()
+        spool = SpooledDownload()
+        try:
+            for block in r.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                if block:
+                    spool.write(block)
+                    if FETCH_MAX_BYTES and spool.size > FETCH_MAX_BYTES:
+                        raise DocumentTooLarge(f"{url} exceeds {FETCH_MAX_BYTES} bytes")
+        except Exception:
+            spool.close()
+            raise
+        spool.finish()
+        trace.update(bytes=spool.size, total_ms=round((time.perf_counter() - t0) * 1000, 1))
+        record("fetch", trace["total_ms"] / 1000, bytes=spool.size)
+        return FetchResult(spool, ext, r.headers.get("ETag", ""), r.headers.get("Last-Modified", ""), trace=trace)
+
 def fetch_document(url: str) -> Tuple[bytes, str]:
-    r = requests.get(url, timeout=DOC_TIMEOUT)
-    r.raise_for_status()
-    content_type = r.headers.get("Content-Type", "")
-    ext = _guess_ext_from_ct(content_type)
-    if not ext:
-        url_path = url.split("?")[0]
-        ext = os.path.splitext(url_path)[1].lower()
-    return r.content, ext
+    res = fetch_document_conditional(url)
+    try:
+        return res.data, res.ext
+    finally:
+        res.spool.close()
 
-def parse_pdf(data: bytes) -> List[Tuple[str, Dict[str, Any]]]:
+def _open_pdf(source: Union[bytes, str]):
     import fitz  # PyMuPDF
-    out = []
-    with fitz.open(stream=data, filetype="pdf") as doc:
+    return fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+
+def iter_pdf_pages(source: Union[bytes, str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with _open_pdf(source) as doc:
         for i, page in enumerate(doc, start=1):
             text = page.get_text("text")
             if text:
-                out.append((_safe_text(text), {"page": i}))
+                yield (_safe_text(text), {"page": i})
+
+def _extract_page_range(source: Tuple[str, str, int], start: int, end: int) -> List[Tuple[str, Dict[str, Any]]]:
+    # runs in a worker process; source is ("path", path, 0) or ("shm", segment name, size)
+    kind, ref, size = source
+    if kind == "shm":
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=ref)
+        try:
+            doc = _open_pdf(bytes(shm.buf[:size]))
+        finally:
+            shm.close()
+    else:
+        doc = _open_pdf(ref)
+    out = []
+    with doc:
+        for i in range(start, end):
+            text = doc[i].get_text("text")
+            if text:
+                out.append((_safe_text(text), {"page": i + 1}))
     return out
 
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            import atexit, multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: the parent is multi-threaded, forking it is not safe
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pdf_pool.shutdown)
+        return _pdf_pool
+
+def _iter_pdf_pages_parallel(source: Union[bytes, str], page_count: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    shm = None
+    if isinstance(source, str):
+        ref = ("path", source, 0)
+    else:
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=max(len(source), 1))
+        shm.buf[:len(source)] = source
+        ref = ("shm", shm.name, len(source))
+    try:
+        # several small ranges per worker keeps results flowing back in order
+        step = max(4, -(-page_count // (PDF_WORKERS * 4)))
+        starts = list(range(0, page_count, step))
+        ends = [min(st + step, page_count) for st in starts]
+        pool = _get_pdf_pool()
+        for pages in pool.map(_extract_page_range, [ref] * len(starts), starts, ends):
+            yield from pages
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+def iter_pdf_pages_fast(source: Union[bytes, str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # large PDFs are split across a process pool; small ones are not worth the IPC
+    if PDF_WORKERS > 1:
+        with _open_pdf(source) as doc:
+            page_count = doc.page_count
+        if page_count >= PDF_PARALLEL_MIN_PAGES:
+            return _iter_pdf_pages_parallel(source, page_count)
+    return iter_pdf_pages(source)
+
+def parse_pdf(data: bytes) -> List[Tuple[str, Dict[str, Any]]]:
+    return list(iter_pdf_pages_fast(data))
+
 def parse_docx(data: bytes) -> List[Tuple[str, Dict[str, Any]]]:
     import docx
     buf = io.BytesIO(data)
@@ -87,8 +292,7 @@ def parse_email(data: bytes) -> List[Tuple[str, Dict[str, Any]]]:
     joined = " ".join([t for t in texts if t])
     return [(joined, {})] if joined else []
 
-def split_into_chunks(pairs: List[Tuple[str, Dict[str, Any]]], chunk_size=1200, overlap=150) -> List[Tuple[str, Dict[str, Any]]]:
-    chunks = []
+def iter_windows(pairs: Iterable[Tuple[str, Dict[str, Any]]], chunk_size=1200, overlap=150) -> Iterator[Tuple[str, Dict[str, Any]]]:
     for text, meta in pairs:
         text = text.strip()
         if not text:
@@ -97,18 +301,16 @@ def split_into_chunks(pairs: List[Tuple[str, Dict[str, Any]]], chunk_size=1200,
         while start < len(text):
             end = min(start + chunk_size, len(text))
             snippet = text[start:end]
-            chunks.append((snippet, dict(meta)))
+            yield (snippet, dict(meta))
             if end == len(text):
                 break
             start = end - overlap
-    return chunks
 
-def ingest(url: str) -> List[DocumentChunk]:
-    data, ext = fetch_document(url)
-    ext = (ext or "").lower()
-
-    doc_id = _hash(url)
+def split_into_chunks(pairs: List[Tuple[str, Dict[str, Any]]], chunk_size=1200, overlap=150) -> List[Tuple[str, Dict[str, Any]]]:
+    return list(iter_windows(pairs, chunk_size=chunk_size, overlap=overlap))
 
+def parse_document(data: bytes, ext: str) -> List[Tuple[str, Dict[str, Any]]]:
+    ext = (ext or "").lower()
     if ext in [".pdf"]:
         pairs = parse_pdf(data)
     elif ext in [".docx"]:
@@ -118,12 +320,25 @@ def ingest(url: str) -> List[DocumentChunk]:
     else:
         txt = data.decode("utf-8", errors="ignore")
         pairs = [(txt, {})]
+    return pairs
 
-    pairs = split_into_chunks(pairs, chunk_size=1200, overlap=150)
+def iter_pages(res: FetchResult) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # PDFs are yielded page by page straight from the spool; other formats are small enough to parse whole
+    if (res.ext or "").lower() == ".pdf":
+        return iter_pdf_pages_fast(res.spool.path or res.spool.getvalue())
+    return iter(parse_document(res.data, res.ext))
 
-    chunks = []
-    for i, (text, meta) in enumerate(pairs):
+def iter_chunks(pairs: Iterable[Tuple[str, Dict[str, Any]]], doc_id: str, url: str) -> Iterator[DocumentChunk]:
+    for i, (text, meta) in enumerate(iter_windows(pairs, chunk_size=1200, overlap=150)):
         chunk_id = f"{doc_id}_{i:04d}"
         meta.update({"doc_id": doc_id, "chunk_index": i, "source_url": url})
-        chunks.append(DocumentChunk(id=chunk_id, text=text, metadata=meta))
-    return chunks
+        yield DocumentChunk(id=chunk_id, text=text, metadata=meta)
+
+def build_chunks(pairs: List[Tuple[str, Dict[str, Any]]], doc_id: str, url: str) -> List[DocumentChunk]:
+    return list(iter_chunks(pairs, doc_id, url))
+
+def ingest(url: str) -> List[DocumentChunk]:
+    data, ext = fetch_document(url)
+    # content-addressed id: same bytes behind a new (e.g. re-signed) URL map to the same chunks
+    doc_id = content_hash(data)
+    return build_chunks(parse_document(data, ext), doc_id, url)
@@ -0,0 +1,213 @@
+
+import time, uuid, threading, contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+from .config import INGEST_WORKERS, INGEST_MAX_PENDING, INGEST_JOB_HISTORY, HYBRID_RETRIEVAL
+from .vectorstore import get_store, shard_name, add_chunks
+from .metrics import stage
+from .embeddings import embedder_name
+from . import doccache, lexical
+
+# Document ingestion (fetch -> parse -> embed -> index) on a bounded worker pool.
+# One DocumentTask per URL is in flight at a time: /hackrx/run, the streaming variant and
+# POST /hackrx/ingest jobs all join the same task, and two URLs that turn out to carry the
+# same content share one parse. Jobs only track summaries, never chunks or vectors.
+
+class QueueFull(Exception):
+    pass
+
+def ingest_into_shard(f: doccache.FetchedDocument) -> doccache.PreparedDocument:
+    # one shard per (document content, embedder model); already-populated shards skip every add
+    model = embedder_name()
+    name = shard_name(f.content_hash, model)
+    shard = get_store(name)
+
+    # the BM25 side needs whole-document statistics; postings accumulate per batch, saved at the end
+    bm25 = lexical.BM25Builder() if HYBRID_RETRIEVAL and not lexical.get_lexical_store().has(name) else None
+
+    def index_batch(chunks, vectors):
+        # each embedded batch becomes searchable while later pages are still being parsed
+        add_chunks(shard, [{"id": ch.id, "text": ch.text, "metadata": ch.metadata} for ch in chunks], vectors)
+        if bm25 is not None:
+            bm25.add([ch.id for ch in chunks], [ch.text for ch in chunks], [ch.metadata for ch in chunks])
+    def resident(n):
+        # the shard serves text from its own column and BM25 is built: skip loading chunks.json
+        return (shard.has_texts() and shard.count() >= n
+                and (not HYBRID_RETRIEVAL or lexical.get_lexical_store().has(name)))
+    doc = doccache.materialize(f, index_batch, resident, model)
+    if bm25 is not None:
+        with stage("lexical_index"):
+            lexical.ensure_index(name, bm25)
+    return doc
+
+class DocumentTask:
+    def __init__(self, url: str):
+        self.url = url
+        self.fetched: Future = Future()  # FetchedDocument
+        self.done: Future = Future()     # PreparedDocument
+        self.status = "queued"           # queued | fetching | ingesting | done | failed
+        # marked running up front: a waiter that gives up (client disconnect cancels its
+        # asyncio wrapper) must not cancel the shared future for everyone else
+        self.fetched.set_running_or_notify_cancel()
+        self.done.set_running_or_notify_cancel()
+
+class IngestQueue:
+    def __init__(self, workers: int, max_pending: int, history: int):
+        self.max_pending = max_pending
+        self.history = history
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._by_url: Dict[str, DocumentTask] = {}
+        self._by_hash: Dict[str, DocumentTask] = {}
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"tasks": 0, "joined": 0, "shared_content": 0, "failed": 0, "rejected": 0}
+
+    def submit(self, url: str, bounded: bool = False) -> DocumentTask:
+        with self._lock:
+            (task, fresh), = self._reserve([url], bounded)
+        if fresh:
+            self._start(task)
+        return task
+
+    def _reserve(self, urls: List[str], bounded: bool) -> List[Tuple[DocumentTask, bool]]:
+        # caller holds the lock; all or nothing, so a rejected job leaves no tasks behind it.
+        # URLs already in flight are joined and do not count against the limit
+        new = [url for url in urls if url not in self._by_url]
+        queued = sum(t.status == "queued" for t in self._by_url.values())
+        if bounded and new and queued + len(new) > self.max_pending:
+            self.stats["rejected"] += 1
+            raise QueueFull(f"ingest queue full ({queued} of {self.max_pending} documents pending, {len(new)} more requested)")
+        out = []
+        for url in urls:
+            task = self._by_url.get(url)
+            if task is not None:
+                self.stats["joined"] += 1
+                out.append((task, False))
+            else:
+                task = DocumentTask(url)
+                self._by_url[url] = task
+                self.stats["tasks"] += 1
+                out.append((task, True))
+        return out
+
+    def submit_fetched(self, f: doccache.FetchedDocument) -> DocumentTask:
+        # uploads arrive with their body, so the task starts at the twin check; concurrent
+        # uploads of the same bytes share one task
+        with self._lock:
+            (task, fresh), = self._reserve([f"upload:{f.content_hash}"], False)
+        if fresh:
+            self._start(task, f)
+        elif f.fetch is not None:
+            f.fetch.spool.close()
+        return task
+
+    def _start(self, task: DocumentTask, fetched: Optional[doccache.FetchedDocument] = None):
+        # the submitter's request context goes along so its stage timings include this work
+        ctx = contextvars.copy_context()
+        self._pool.submit(ctx.run, self._run, task, fetched)
+
+    def _run(self, task: DocumentTask, fetched: Optional[doccache.FetchedDocument] = None):
+        owner = False
+        try:
+            task.status = "fetching"
+            f = fetched if fetched is not None else doccache.fetch(task.url)
+            task.fetched.set_result(f)
+            task.status = "ingesting"
+            with self._lock:
+                twin = self._by_hash.get(f.content_hash)
+                if twin is None:
+                    self._by_hash[f.content_hash] = task
+                    owner = True
+            if twin is not None:
+                # same bytes behind another URL are already being ingested
+                if f.fetch is not None:
+                    f.fetch.spool.close()
+                with self._lock:
+                    self.stats["shared_content"] += 1
+                doc = replace(twin.done.result(), url=task.url, cache="hit", trace=f.trace)
+            else:
+                doc = ingest_into_shard(f)
+            task.status = "done"
+            task.done.set_result(doc)
+        except BaseException as e:
+            task.status = "failed"
+            with self._lock:
+                self.stats["failed"] += 1
+            if not task.fetched.done():
+                task.fetched.set_exception(e)
+            task.done.set_exception(e)
+        finally:
+            with self._lock:
+                if self._by_url.get(task.url) is task:
+                    del self._by_url[task.url]
+                if owner:
+                    self._by_hash.pop(task.fetched.result().content_hash, None)
+
+    def create_job(self, urls: List[str]) -> Dict[str, Any]:
+        with self._lock:
+            reserved = self._reserve(list(dict.fromkeys(urls)), bounded=True)
+            job = {"job_id": uuid.uuid4().hex, "created_at": time.time(), "tasks": [t for t, _ in reserved]}
+            self._jobs[job["job_id"]] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        for task, fresh in reserved:
+            if fresh:
+                self._start(task)
+            task.done.add_done_callback(lambda _, job=job: self._settle(job))
+        return self.job_status(job["job_id"])
+
+    def _settle(self, job: Dict[str, Any]):
+        # swap finished tasks for their summaries so old jobs do not pin chunks and vectors
+        with self._lock:
+            docs = [_summary(t) if isinstance(t, DocumentTask) and t.done.done() else t for t in job["tasks"]]
+            job["tasks"] = docs
+            if all(isinstance(t, dict) for t in docs) and "finished_at" not in job:
+                job["finished_at"] = time.time()
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            tasks = list(job["tasks"])
+            finished_at = job.get("finished_at")
+        docs = [t if isinstance(t, dict) else _summary(t) for t in tasks]
+        states = {d["status"] for d in docs}
+        if states <= {"done", "failed"}:
+            status = "failed" if "failed" in states else "done"
+        else:
+            status = "queued" if states == {"queued"} else "running"
+        out = {"job_id": job_id, "status": status, "created_at": job["created_at"], "documents": docs}
+        if finished_at is not None:
+            out["finished_at"] = finished_at
+        return out
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._by_url), jobs=len(self._jobs))
+
+def _summary(task: DocumentTask) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"url": task.url, "status": task.status}
+    if task.done.done():
+        err = task.done.exception()
+        if err is not None:
+            out["status"], out["error"] = "failed", str(err) or type(err).__name__
+        else:
+            doc = task.done.result()
+            out.update(content_hash=doc.content_hash, chunks=doc.n_chunks, cache=doc.cache, **doc.trace)
+    return out
+
+_queue: Optional[IngestQueue] = None
+_queue_lock = threading.Lock()
+
+def get_ingest_queue() -> IngestQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue(INGEST_WORKERS, INGEST_MAX_PENDING, INGEST_JOB_HISTORY)
+        return _queue
+
+def ingest_stats() -> Dict[str, int]:
+    return get_ingest_queue().snapshot()
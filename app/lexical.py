@@ -0,0 +1,207 @@
+
+import os, re, json, math, threading
+import numpy as np
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .config import STORAGE_DIR, BM25_K1, BM25_B, LEXICAL_CACHE_MAX
+from .chunkstore import pack
+
+# Per-document BM25 index, built once per content hash next to the vector shard and kept as
+# flat postings arrays: sorted vocabulary -> [start, end) slice of (chunk row, term frequency).
+# Exact wording ("grace period", "Section 3.2", disease names) is what MiniLM ranks poorly,
+# so retrieval fuses these hits with the dense ones (see retrieval.py).
+
+_TOKEN = re.compile(r"[0-9a-z]+(?:[./\-][0-9a-z]+)*")
+_STOP = frozenset("""a an and are as at be by can do does for from has have how i if in is it its of on or
+that the their there this to under was what when where which who will with within would""".split())
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok in _STOP:
+            continue
+        # light plural folding so "diseases" matches "disease"
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss") and tok.isalpha():
+            tok = tok[:-1]
+        out.append(tok)
+        if "-" in tok or "/" in tok:
+            # "pre-existing" also matches "pre existing"
+            out.extend(p for p in re.split(r"[/\-]", tok) if p and p not in _STOP)
+    return out
+
+class BM25Index:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.terms = arrays["terms"]
+        self.term_offsets = arrays["term_offsets"]
+        self.rows = arrays["rows"]
+        self.tf = arrays["tf"]
+        self.doc_len = arrays["doc_len"]
+        self.ids = arrays["ids"]
+        self.meta_blob, self.meta_offsets = arrays["meta_blob"], arrays["meta_offsets"]
+        self.n = len(self.ids)
+        self.avgdl = float(self.doc_len.mean()) if self.n else 0.0
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str], metas: Sequence[Dict[str, Any]]) -> "BM25Index":
+        builder = BM25Builder()
+        builder.add(ids, texts, metas)
+        return builder.finish()
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"terms": self.terms, "term_offsets": self.term_offsets, "rows": self.rows, "tf": self.tf,
+                "doc_len": self.doc_len, "ids": self.ids, "meta_blob": self.meta_blob, "meta_offsets": self.meta_offsets}
+
+    def scores(self, tokens: Sequence[str]) -> np.ndarray:
+        out = np.zeros(self.n, dtype="float32")
+        if not self.n or not len(self.terms):
+            return out
+        for term in set(tokens):
+            key = term.encode("utf-8")
+            j = int(np.searchsorted(self.terms, key))
+            if j >= len(self.terms) or self.terms[j] != key:
+                continue
+            s, e = int(self.term_offsets[j]), int(self.term_offsets[j + 1])
+            rows, tf = self.rows[s:e], self.tf[s:e].astype("float32")
+            idf = math.log(1 + (self.n - (e - s) + 0.5) / ((e - s) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[rows] / max(self.avgdl, 1e-9))
+            out[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return out
+
+    def hit(self, row: int, score: float) -> Tuple[str, float, Dict[str, Any]]:
+        raw = self.meta_blob[self.meta_offsets[row]:self.meta_offsets[row + 1]].tobytes()
+        return self.ids[row].decode("utf-8"), float(score), json.loads(raw)
+
+    def search(self, tokens: Sequence[str], top_k: int) -> List[Tuple[str, float, Dict[str, Any]]]:
+        sc = self.scores(tokens)
+        nz = np.flatnonzero(sc > 0)
+        if not len(nz):
+            return []
+        top = nz[np.argsort(-sc[nz], kind="stable")[:top_k]]
+        return [self.hit(int(r), sc[r]) for r in top]
+
+# Accumulates postings batch by batch as compact (term, row, tf) arrays, so ingest can feed it
+# from the pipeline instead of keeping every chunk text until the document is done
+class BM25Builder:
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._doc_len: List[int] = []
+        self._ids: List[bytes] = []
+        self._metas: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metas: Sequence[Dict[str, Any]]):
+        term_ids, rows, tfs = [], [], []
+        for cid, text, meta in zip(ids, texts, metas):
+            row = len(self._ids)
+            counts = Counter(tokenize(text))
+            self._doc_len.append(sum(counts.values()))
+            self._ids.append(cid.encode("utf-8"))
+            self._metas.append(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            for term, tf in counts.items():
+                term_ids.append(self._vocab.setdefault(term, len(self._vocab)))
+                rows.append(row)
+                tfs.append(tf)
+        self._parts.append((np.array(term_ids, dtype="int64"), np.array(rows, dtype="int32"),
+                            np.minimum(np.array(tfs, dtype="int64"), 65535).astype("uint16")))
+
+    def finish(self) -> BM25Index:
+        terms = sorted(self._vocab)
+        rank = np.zeros(len(terms), dtype="int64")
+        rank[[self._vocab[t] for t in terms]] = np.arange(len(terms))
+        keys = rank[np.concatenate([p[0] for p in self._parts])] if self._parts else np.zeros(0, dtype="int64")
+        # stable: postings of a term stay in row order
+        order = np.argsort(keys, kind="stable")
+        term_offsets = np.zeros(len(terms) + 1, dtype="int64")
+        term_offsets[1:] = np.cumsum(np.bincount(keys, minlength=len(terms)))
+        meta_blob, meta_offsets = pack(self._metas)
+        return BM25Index({
+            "terms": np.array([t.encode("utf-8") for t in terms], dtype="S") if terms else np.zeros(0, dtype="S1"),
+            "term_offsets": term_offsets,
+            "rows": np.concatenate([p[1] for p in self._parts])[order] if self._parts else np.zeros(0, dtype="int32"),
+            "tf": np.concatenate([p[2] for p in self._parts])[order] if self._parts else np.zeros(0, dtype="uint16"),
+            "doc_len": np.array(self._doc_len, dtype="int32"),
+            "ids": np.array(self._ids, dtype="S") if self._ids else np.zeros(0, dtype="S1"),
+            "meta_blob": meta_blob, "meta_offsets": meta_offsets,
+        })
+
+# Searches the BM25 indexes of several documents; hits are merged by score
+class LexicalSearcher:
+    def __init__(self, indexes: List[BM25Index]):
+        self.indexes = indexes
+
+    def search_many(self, questions: Sequence[str], top_k: int) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        out = []
+        for q in questions:
+            tokens = tokenize(q)
+            hits = [h for ix in self.indexes for h in ix.search(tokens, top_k)] if tokens else []
+            hits.sort(key=lambda h: -h[1])
+            out.append(hits[:top_k])
+        return out
+
+class LexicalStore:
+    def __init__(self, root: str, max_loaded: int = LEXICAL_CACHE_MAX):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.bm25.npz")
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def save(self, name: str, index: BM25Index):
+        path = self._path(name)
+        tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}.npz"
+        np.savez(tmp, **index.arrays())
+        os.replace(tmp, path)
+        self._remember(name, index)
+
+    def get(self, name: str) -> Optional[BM25Index]:
+        with self._lock:
+            index = self._loaded.get(name)
+            if index is not None:
+                self._loaded.move_to_end(name)
+                return index
+        if not self.has(name):
+            return None
+        try:
+            with np.load(self._path(name)) as z:
+                index = BM25Index({k: z[k] for k in z.files})
+        except Exception:
+            return None
+        self._remember(name, index)
+        return index
+
+    def _remember(self, name: str, index: BM25Index):
+        with self._lock:
+            self._loaded[name] = index
+            self._loaded.move_to_end(name)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+_store: Optional[LexicalStore] = None
+_store_lock = threading.Lock()
+
+def get_lexical_store() -> LexicalStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LexicalStore(os.path.join(STORAGE_DIR, "bm25"))
+        return _store
+
+def ensure_index(name: str, builder: BM25Builder) -> None:
+    # a no-op once the file exists (another worker built it) or when nothing was fed in
+    store = get_lexical_store()
+    if store.has(name) or not len(builder):
+        return
+    store.save(name, builder.finish())
+
+def get_searcher(names: List[str]) -> LexicalSearcher:
+    store = get_lexical_store()
+    return LexicalSearcher([ix for ix in (store.get(n) for n in dict.fromkeys(names)) if ix is not None])
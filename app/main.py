@@ -1,16 +1,24 @@
 
-import os, hashlib
-from fastapi import FastAPI, Body, Depends, Query
+import os, json, asyncio, logging
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Body, Depends, Query, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from .config import API_PREFIX
+from .config import API_PREFIX, ANSWER_CACHE_ENABLED, HYBRID_RETRIEVAL
 from .security import require_bearer
-from .models import RunRequest, RunResponse, Answer
-from . import ingest
-from .vectorstore import upsert_chunks
-from .retrieval import retrieve
-from .reasoner import call_llm
+from .models import RunRequest, RunResponse, Answer, IngestRequest
+from . import ingest, anscache, doccache, jobs, lexical
+from .vectorstore import get_shards, shard_name
+from .retrieval import retrieve_many
+from .reasoner import answer_all, iter_answers
+from .warmup import run_warmup, readiness, record_failure
+from .vectorstore import store_cache_stats
+from .embcache import embedding_cache_stats
+from .metrics import histograms, render_prometheus, start_request, record, stage
 
 app = FastAPI(title="LLM Query Retrieval API", version="1.0.0")
+log = logging.getLogger(__name__)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,45 +28,89 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_warmup():
+    # warm in the background so /health answers immediately; /ready flips once done
+    app.state.warmup = asyncio.get_running_loop().run_in_executor(None, run_warmup)
+    app.state.warmup.add_done_callback(_warmup_done)
+
+def _warmup_done(fut: "asyncio.Future"):
+    if fut.cancelled():
+        return
+    exc = fut.exception()
+    if exc is not None:
+        log.error("warmup failed", exc_info=exc)
+        record_failure(exc)
+
 @app.get(API_PREFIX + "/health")
 def health():
     return {"status": "ok"}
 
-def _doc_index_name(urls):
-    m = hashlib.sha256(("|".join(sorted(urls))).encode("utf-8")).hexdigest()[:10]
-    return f"idx_{m}"
+@app.get(API_PREFIX + "/stats")
+def stats():
+    return {
+        "doc_cache": doccache.cache_stats(),
+        "store_cache": store_cache_stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "answer_cache": anscache.answer_cache_stats(),
+        "ingest": jobs.ingest_stats(),
+        "histograms": {name: h.snapshot() for name, h in histograms().items()},
+    }
 
-@app.post(API_PREFIX + "/hackrx/run", response_model=RunResponse)
-def run_submission(req: RunRequest = Body(...), _: bool = Depends(require_bearer), debug: bool = Query(False)):
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def ready():
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+def _doc_urls(req) -> List[str]:
     if isinstance(req.documents, str):
-        doc_urls = [req.documents]
+        return [req.documents]
     elif isinstance(req.documents, list):
-        doc_urls = req.documents
+        return req.documents
     else:
         raise ValueError("`documents` must be a string URL or list of URLs")
 
-    all_chunks = []
-    id_to_text = {}
-    for url in doc_urls:
-        chunks = ingest.ingest(url)
-        for ch in chunks:
-            all_chunks.append({"id": ch.id, "text": ch.text, "metadata": ch.metadata})
-            id_to_text[ch.id] = ch.text
+def _ingest_failed(errors):
+    if isinstance(errors[0], ingest.DocumentTooLarge):
+        raise HTTPException(status_code=413, detail=str(errors[0]))
+    raise errors[0]
 
-    index_name = _doc_index_name(doc_urls)
-    store = upsert_chunks(index_name, all_chunks)
+def _submit(doc_urls: List[str]) -> List[jobs.DocumentTask]:
+    # joins an in-flight ingest (e.g. from POST /hackrx/ingest) instead of starting another
+    queue = jobs.get_ingest_queue()
+    return [queue.submit(url) for url in doc_urls]
 
-    answers = []
-    traces = []
+async def _retrieve(questions, docs):
+    store = await run_in_threadpool(get_shards, [d.content_hash for d in docs])
+    # shards written before the chunk-text column (and Pinecone) still need the parsed chunks
+    id_to_text = None
+    if not store.has_texts():
+        id_to_text = await run_in_threadpool(doccache.chunk_texts, [d.content_hash for d in docs], docs)
+    searcher = None
+    if HYBRID_RETRIEVAL:
+        searcher = await run_in_threadpool(lexical.get_searcher, [shard_name(d.content_hash) for d in docs])
+    contexts_list, qvecs = await run_in_threadpool(retrieve_many, store, questions, id_to_text, True, searcher)
+    scope = None
+    cached = [None] * len(questions)
+    if ANSWER_CACHE_ENABLED:
+        scope = anscache.scope_for([d.content_hash for d in docs])
+        cached = await run_in_threadpool(anscache.get_answer_cache().get_many, scope, questions, contexts_list, qvecs)
+        hits = sum(c is not None for c in cached)
+        record("answer_cache", hits=hits, misses=len(cached) - hits)
+    return contexts_list, qvecs, cached, scope
 
-    for q in req.questions:
-        contexts = retrieve(store, q, id_to_text)
-        llm_out = call_llm(q, contexts)
-        answers.append(llm_out.get("answer", "Not explicitly stated."))
+async def _remember(scope, questions, contexts_list, qvecs, todo, fresh):
+    if ANSWER_CACHE_ENABLED and todo:
+        await run_in_threadpool(anscache.get_answer_cache().put_many, scope, [questions[i] for i in todo],
+                                [contexts_list[i] for i in todo], qvecs[todo], fresh)
 
-        if debug:
-            cited = set(llm_out.get("citations", []))
-            traces.append(Answer(
+def _trace(contexts, llm_out, hit):
+    cited = set(llm_out.get("citations", []))
+    return Answer(
     answer=llm_out.get("answer", ""),
     reasoning=llm_out.get("reasoning", ""),
     confidence=llm_out.get("confidence", None),
@@ -66,12 +118,144 @@ def run_submission(req: RunRequest = Body(...), _: bool = Depends(require_bearer
         "id": c["id"],
         "score": c["score"],
         "metadata": c["metadata"]
-    } for c in contexts if c["id"] in cited]
-).model_dump())
+    } for c in contexts if c["id"] in cited],
+    **({"cache": hit[1]} if hit is not None else {})
+).model_dump()
+
+def _doc_info(d):
+    return {
+        "url": d.url,
+        "content_hash": d.content_hash,
+        "chunks": d.n_chunks,
+        "cache": d.cache,
+        **d.trace,
+    }
+
+@app.post(API_PREFIX + "/hackrx/run", response_model=RunResponse)
+async def run_submission(response: Response, req: RunRequest = Body(...), _: bool = Depends(require_bearer),
+                         debug: bool = Query(False)):
+    timings = start_request()
+    doc_urls = _doc_urls(req)
+
+    # documents are fetched and ingested in parallel on the ingest pool; a submission waits on the slowest one
+    tasks = _submit(doc_urls)
+    docs = await asyncio.gather(*[asyncio.wrap_future(t.done) for t in tasks], return_exceptions=True)
+    errors = [d for d in docs if isinstance(d, BaseException)]
+    if errors:
+        _ingest_failed(errors)
+
+    answers = []
+    traces = []
 
+    contexts_list, qvecs, cached, scope = await _retrieve(req.questions, docs)
 
+    # only cache misses go to the LLM
+    todo = [i for i, c in enumerate(cached) if c is None]
+    with stage("answer"):
+        fresh = await answer_all([req.questions[i] for i in todo], [contexts_list[i] for i in todo])
+    await _remember(scope, req.questions, contexts_list, qvecs, todo, fresh)
+    llm_outs = [c[0] if c is not None else None for c in cached]
+    for i, out in zip(todo, fresh):
+        llm_outs[i] = out
+
+    for contexts, llm_out, hit in zip(contexts_list, llm_outs, cached):
+        answers.append(llm_out.get("answer", "Not explicitly stated."))
+
+        if debug:
+            traces.append(_trace(contexts, llm_out, hit))
 
     resp = {"answers": answers}
     if debug:
         resp["traces"] = traces
+        resp["documents"] = [_doc_info(d) for d in docs]
+        if timings is not None:
+            resp["timings"] = timings.snapshot()
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.server_timing()
     return resp
+
+def _event(fmt: str, name: str, data: Dict[str, Any]) -> str:
+    if fmt == "sse":
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": name, **data}, ensure_ascii=False) + "\n"
+
+async def _stream_submission(req: RunRequest, doc_urls: List[str], fmt: str, debug: bool):
+    # same stages as run_submission, reporting each document and answer as it completes
+    timings = start_request()
+    async def fetch_one(i, task):
+        try:
+            return i, await asyncio.wrap_future(task.fetched)
+        except Exception as e:
+            return i, e
+
+    fetched: List[Any] = [None] * len(doc_urls)
+    try:
+        tasks = _submit(doc_urls)
+        for fut in asyncio.as_completed([fetch_one(i, t) for i, t in enumerate(tasks)]):
+            i, f = await fut
+            fetched[i] = f
+            if not isinstance(f, Exception):
+                yield _event(fmt, "fetched", {"document": i, "url": f.url, "content_hash": f.content_hash, "cache": f.cache})
+        errors = [f for f in fetched if isinstance(f, Exception)]
+        if errors:
+            _ingest_failed(errors)
+
+        docs = []
+        for i, t in enumerate(tasks):
+            d = await asyncio.wrap_future(t.done)
+            docs.append(d)
+            info = _doc_info(d) if debug else {"url": d.url, "content_hash": d.content_hash, "chunks": d.n_chunks}
+            yield _event(fmt, "ingested", {"document": i, **info})
+
+        contexts_list, qvecs, cached, scope = await _retrieve(req.questions, docs)
+        yield _event(fmt, "retrieved", {"questions": len(req.questions)})
+
+        answers: List[Optional[str]] = [None] * len(req.questions)
+
+        def answer_event(i, llm_out, hit):
+            answers[i] = llm_out.get("answer", "Not explicitly stated.")
+            data = {"index": i, "answer": answers[i]}
+            if debug:
+                data["trace"] = _trace(contexts_list[i], llm_out, hit)
+            return _event(fmt, "answer", data)
+
+        for i, hit in enumerate(cached):
+            if hit is not None:
+                yield answer_event(i, hit[0], hit)
+        todo = [i for i, c in enumerate(cached) if c is None]
+        fresh: List[Dict[str, Any]] = [{}] * len(todo)
+        async for j, llm_out in iter_answers([req.questions[i] for i in todo], [contexts_list[i] for i in todo]):
+            fresh[j] = llm_out
+            yield answer_event(todo[j], llm_out, None)
+        await _remember(scope, req.questions, contexts_list, qvecs, todo, fresh)
+        if debug and timings is not None:
+            yield _event(fmt, "timings", timings.snapshot())
+        yield _event(fmt, "done", {"answers": answers})
+    except HTTPException as e:
+        yield _event(fmt, "error", {"status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        yield _event(fmt, "error", {"status": 500, "detail": str(e)})
+
+@app.post(API_PREFIX + "/hackrx/run/stream")
+async def run_submission_stream(req: RunRequest = Body(...), _: bool = Depends(require_bearer),
+                                debug: bool = Query(False), format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    # opt-in streaming variant; /hackrx/run keeps the plain RunResponse contract
+    doc_urls = _doc_urls(req)
+    media = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_submission(req, doc_urls, format, debug), media_type=media,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post(API_PREFIX + "/hackrx/ingest", status_code=202)
+def create_ingest_job(req: IngestRequest = Body(...), _: bool = Depends(require_bearer)):
+    # warm documents ahead of query traffic; /hackrx/run for the same URLs joins these tasks
+    try:
+        return jobs.get_ingest_queue().create_job(_doc_urls(req))
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get(API_PREFIX + "/hackrx/ingest/{job_id}")
+def ingest_job_status(job_id: str, _: bool = Depends(require_bearer)):
+    status = jobs.get_ingest_queue().job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="unknown job id")
+    return status
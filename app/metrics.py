@@ -0,0 +1,173 @@
+
+import bisect, threading, time
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Sequence
+from .config import METRICS_ENABLED
+
+# Cumulative-bucket histogram (Prometheus semantics); cheap enough for hot paths
+class Histogram:
+    def __init__(self, name: str, buckets: Sequence[float], help: str = ""):
+        self.name = name
+        self.help = help
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total, n = list(self._counts), self._sum, self._count
+        cumulative, running = {}, 0
+        for le, c in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+            running += c
+            cumulative[le] = running
+        return {"buckets": cumulative, "sum": total, "count": n}
+
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+def histogram(name: str, buckets: Sequence[float], help: str = "") -> Histogram:
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram(name, buckets, help)
+        return h
+
+def histograms() -> Dict[str, Histogram]:
+    with _lock:
+        return dict(_histograms)
+
+class Counter:
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+_counters: Dict[str, Counter] = {}
+
+def counter(name: str, help: str = "") -> Counter:
+    with _lock:
+        c = _counters.get(name)
+        if c is None:
+            c = _counters[name] = Counter(name, help)
+        return c
+
+def render_prometheus() -> str:
+    # text exposition format 0.0.4
+    lines = []
+    for name, h in sorted(histograms().items()):
+        snap = h.snapshot()
+        if h.help:
+            lines.append(f"# HELP {name} {h.help}")
+        lines.append(f"# TYPE {name} histogram")
+        for le, n in snap["buckets"].items():
+            lines.append(f'{name}_bucket{{le="{le}"}} {n}')
+        lines.append(f"{name}_sum {snap['sum']}")
+        lines.append(f"{name}_count {snap['count']}")
+    with _lock:
+        counters = sorted(_counters.items())
+    for name, c in counters:
+        if c.help:
+            lines.append(f"# HELP {name} {c.help}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {c.value}")
+    return "\n".join(lines) + "\n"
+
+# === Per-stage timings ===
+# record()/stage() feed a process-wide histogram per stage plus, when a request started
+# timing, that request's totals (Server-Timing header, debug output). Worker threads see
+# the request through contextvars (run_in_threadpool copies the context).
+STAGE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: Optional[float], counts: Dict[str, float]):
+        with self._lock:
+            s = self.stages.setdefault(name, {"ms": 0.0, "calls": 0})
+            if seconds is not None:
+                s["ms"] += seconds * 1000
+                s["calls"] += 1
+            for k, v in counts.items():
+                s[k] = s.get(k, 0) + v
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {name: dict(s, ms=round(s["ms"], 1)) for name, s in self.stages.items()}
+        out["total"] = {"ms": round((time.perf_counter() - self.started) * 1000, 1), "calls": 1}
+        return out
+
+    def server_timing(self) -> str:
+        # stages that ran in parallel (llm calls, shard searches) report summed time
+        return ", ".join(f"{name};dur={s['ms']}" for name, s in self.snapshot().items() if s["calls"])
+
+_request: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def start_request() -> Optional[RequestTimings]:
+    if not METRICS_ENABLED:
+        return None
+    timings = RequestTimings()
+    _request.set(timings)
+    return timings
+
+def record(name: str, seconds: Optional[float] = None, **counts: float):
+    if not METRICS_ENABLED:
+        return
+    if seconds is not None:
+        histogram(f"stage_{name}_seconds", STAGE_BUCKETS, f"Duration of the {name} stage").observe(seconds)
+    for k, v in counts.items():
+        counter(f"{name}_{k}_total").inc(v)
+    timings = _request.get()
+    if timings is not None:
+        timings.add(name, seconds, counts)
+
+class _Stage:
+    __slots__ = ("name", "counts", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts: Dict[str, float] = {}
+
+    def add(self, **counts: float):
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.t0, **self.counts)
+        return False
+
+class _NoStage:
+    def add(self, **counts: float):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_STAGE = _NoStage()
+
+def stage(name: str):
+    # with stage("embed") as st: ...; st.add(chunks=n)
+    return _Stage(name) if METRICS_ENABLED else _NO_STAGE
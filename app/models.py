@@ -1,18 +1,25 @@
 
 from typing import List, Optional, Any, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 class RunRequest(BaseModel):
     documents: Any  # Can be str (single URL) or List[str]
     questions: List[str]
 
+class IngestRequest(BaseModel):
+    documents: Any  # str or List[str], same as RunRequest
+
 class Answer(BaseModel):
+    model_config = ConfigDict(extra="allow")  # "cache": "exact" / "semantic" when served from the answer cache
     answer: str
     reasoning: Optional[str] = None
     confidence: Optional[float] = None
     source_clauses: Optional[list] = None  # list of dicts
 
 class RunResponse(BaseModel):
+    # debug runs also carry "documents" (per-document ingest/cache info) and "timings" (per-stage ms / counts);
+    # they pass through as extra keys so the non-debug body stays {"answers": [...], "traces": null}
+    model_config = ConfigDict(extra="allow")
     answers: List[str]  # keep to exact spec expected by judge
     # Optional debug output if user adds ?debug=true
     traces: Optional[List[Answer]] = None
@@ -0,0 +1,166 @@
+
+import json, time, threading, types
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from .config import (PINECONE_API_KEY, PINECONE_ENV, PINECONE_INDEX, PINECONE_CLOUD, PINECONE_REGION, PINECONE_LOCAL,
+                     PINECONE_BATCH_SIZE, PINECONE_MAX_REQUEST_BYTES, PINECONE_UPSERT_WORKERS, PINECONE_RETRIES)
+from .metrics import record
+
+# Shared Pinecone index handle, batched parallel upserts and an in-memory stand-in with the
+# same upsert/query/fetch/describe_index_stats surface (PINECONE_LOCAL=true, and the benchmark).
+# Works with pinecone-client 3+ (Pinecone class) and the older pinecone.init module API.
+
+Vector = Tuple[str, List[float], Dict[str, Any]]
+
+def _field(obj, name: str, default=None):
+    # client 2.x returns dicts, 3+ returns objects
+    return obj.get(name, default) if isinstance(obj, dict) else getattr(obj, name, default)
+
+class MemoryIndex:
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        self._ns: Dict[str, Dict[str, Tuple[np.ndarray, Dict[str, Any]]]] = {}
+
+    def upsert(self, vectors: Sequence[Vector], namespace: str = "", **kw):
+        with self._lock:
+            rows = self._ns.setdefault(namespace, {})
+            for vid, values, meta in vectors:
+                if len(values) != self.dimension:
+                    raise ValueError(f"vector dimension {len(values)} does not match the index dimension {self.dimension}")
+                rows[vid] = (np.asarray(values, dtype="float32"), dict(meta or {}))
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k: int, include_metadata: bool = True, namespace: str = "", **kw):
+        with self._lock:
+            rows = dict(self._ns.get(namespace, {}))
+        matches = []
+        if rows:
+            ids = list(rows)
+            mat = np.stack([rows[i][0] for i in ids])
+            q = np.asarray(vector, dtype="float32")
+            # cosine, as the real index is created with metric="cosine"
+            scores = mat @ q / np.maximum(np.linalg.norm(mat, axis=1) * np.linalg.norm(q), 1e-12)
+            for j in np.argsort(-scores)[:top_k]:
+                meta = rows[ids[j]][1] if include_metadata else None
+                matches.append(types.SimpleNamespace(id=ids[j], score=float(scores[j]), metadata=meta))
+        return types.SimpleNamespace(matches=matches)
+
+    def fetch(self, ids: Sequence[str], namespace: str = "", **kw):
+        with self._lock:
+            rows = self._ns.get(namespace, {})
+            found = {i: types.SimpleNamespace(id=i, values=rows[i][0].tolist(), metadata=rows[i][1]) for i in ids if i in rows}
+        return types.SimpleNamespace(vectors=found)
+
+    def describe_index_stats(self, **kw):
+        with self._lock:
+            namespaces = {ns: types.SimpleNamespace(vector_count=len(rows)) for ns, rows in self._ns.items()}
+        return types.SimpleNamespace(dimension=self.dimension, namespaces=namespaces,
+                                     total_vector_count=sum(n.vector_count for n in namespaces.values()))
+
+_indexes: Dict[str, Any] = {}
+_index_lock = threading.Lock()
+
+def _client():
+    # (client, True) on pinecone-client 3+, (module, False) on 2.x
+    import pinecone
+    if hasattr(pinecone, "Pinecone"):
+        return pinecone.Pinecone(api_key=PINECONE_API_KEY), True
+    pinecone.init(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
+    return pinecone, False
+
+def _open(name: str, dimension: int):
+    client, modern = _client()
+    listed = client.list_indexes()
+    names = listed.names() if hasattr(listed, "names") else [_field(i, "name", i) for i in listed]
+    if name not in names:
+        if modern:
+            from pinecone import ServerlessSpec
+            client.create_index(name=name, dimension=dimension, metric="cosine",
+                                spec=ServerlessSpec(cloud=PINECONE_CLOUD, region=PINECONE_REGION))
+        else:
+            client.create_index(name, dimension=dimension, metric="cosine")
+    else:
+        existing = _field(client.describe_index(name), "dimension")
+        if existing and int(existing) != dimension:
+            raise ValueError(f"Pinecone index {name} has dimension {existing}, the embedder produces {dimension}")
+    return client.Index(name)
+
+def get_index(dimension: int, name: Optional[str] = None):
+    # one handle per (index, dimension) for the process; list/create only happens on first use
+    name = name or PINECONE_INDEX
+    key = f"{name}:{dimension}"
+    with _index_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = MemoryIndex(dimension) if PINECONE_LOCAL else _open(name, dimension)
+            _indexes[key] = index
+        return index
+
+def reset_indexes():
+    with _index_lock:
+        _indexes.clear()
+
+def _request_bytes(v: Vector) -> int:
+    # JSON-encoded floats run ~12 bytes each; metadata and the id go as-is
+    return len(v[0]) + 12 * len(v[1]) + len(json.dumps(v[2] or {}, ensure_ascii=False)) + 32
+
+def batches(vectors: Sequence[Vector], max_count: int = PINECONE_BATCH_SIZE,
+            max_bytes: int = PINECONE_MAX_REQUEST_BYTES) -> List[List[Vector]]:
+    out, cur, size = [], [], 0
+    for v in vectors:
+        b = _request_bytes(v)
+        if cur and (len(cur) >= max_count or size + b > max_bytes):
+            out.append(cur)
+            cur, size = [], 0
+        cur.append(v)
+        size += b
+    if cur:
+        out.append(cur)
+    return out
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _upsert_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PINECONE_UPSERT_WORKERS, thread_name_prefix="pinecone-upsert")
+        return _pool
+
+def upsert_batched(index, vectors: Sequence[Vector], namespace: str = "") -> int:
+    parts = batches(vectors)
+    retries = [0]
+
+    def send(batch):
+        for attempt in range(PINECONE_RETRIES + 1):
+            try:
+                return index.upsert(vectors=batch, namespace=namespace)
+            except ValueError:
+                raise  # malformed request; retrying cannot help
+            except Exception:
+                if attempt == PINECONE_RETRIES:
+                    raise
+                retries[0] += 1
+                time.sleep(min(8.0, 0.5 * 2 ** attempt))
+
+    if len(parts) <= 1:
+        for p in parts:
+            send(p)
+    else:
+        list(_upsert_pool().map(send, parts))
+    record("pinecone_upsert", batches=len(parts), vectors=len(vectors), retries=retries[0])
+    return len(vectors)
+
+def namespace_count(index, namespace: str) -> int:
+    namespaces = _field(index.describe_index_stats(), "namespaces", {}) or {}
+    return int(_field(namespaces.get(namespace), "vector_count", 0) or 0) if namespace in namespaces else 0
+
+def fetch_ids(index, ids: Sequence[str], namespace: str = "", batch: int = 200) -> Set[str]:
+    found: Set[str] = set()
+    for i in range(0, len(ids), batch):
+        res = index.fetch(ids=list(ids[i:i + batch]), namespace=namespace)
+        found.update((_field(res, "vectors", {}) or {}).keys())
+    return found
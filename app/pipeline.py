@@ -0,0 +1,106 @@
+
+import queue, threading, time, contextvars
+import numpy as np
+from typing import Callable, Iterable, List, Optional
+from .config import EMBED_BATCH_SIZE, INGEST_QUEUE_SIZE
+from .embeddings import embed_texts
+from .ingest import DocumentChunk
+from .metrics import record
+
+# parse/chunk -> embed -> sink, each stage on its own thread joined by bounded queues so a
+# slow stage back-pressures the one before it instead of buffering the whole document
+
+_DONE = object()
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+def _put(q: "queue.Queue", item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def _chunk_stage(chunks: Iterable[DocumentChunk], out: "queue.Queue", stop: threading.Event, batch_size: int):
+    try:
+        batch = []
+        busy, n = 0.0, 0  # time spent parsing/chunking, not waiting on the embed stage
+        it = iter(chunks)
+        while True:
+            t0 = time.perf_counter()
+            ch = next(it, None)
+            busy += time.perf_counter() - t0
+            if ch is None or stop.is_set():
+                break
+            batch.append(ch)
+            n += 1
+            if len(batch) >= batch_size:
+                _put(out, batch, stop)
+                batch = []
+        if stop.is_set():
+            return
+        record("parse", busy, chunks=n)
+        if batch:
+            _put(out, batch, stop)
+        _put(out, _DONE, stop)
+    except BaseException as e:
+        _put(out, _Failed(e), stop)
+
+def _embed_stage(inq: "queue.Queue", out: "queue.Queue", stop: threading.Event, model: Optional[str]):
+    busy, n = 0.0, 0
+    while not stop.is_set():
+        try:
+            item = inq.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE or isinstance(item, _Failed):
+            if item is _DONE:
+                record("embed", busy, chunks=n)
+            _put(out, item, stop)
+            return
+        try:
+            t0 = time.perf_counter()
+            vectors = embed_texts([c.text for c in item], model).astype("float32")
+            busy += time.perf_counter() - t0
+            n += len(item)
+        except BaseException as e:
+            _put(out, _Failed(e), stop)
+            return
+        _put(out, (item, vectors), stop)
+
+def run_pipeline(chunks: Iterable[DocumentChunk], sink: Optional[Callable[[List[DocumentChunk], np.ndarray], None]] = None,
+                 batch_size: int = EMBED_BATCH_SIZE, model: Optional[str] = None) -> int:
+    # each embedded batch goes to `sink` as soon as it is ready and is then dropped, so peak memory
+    # stays at a few batches whatever the document size; returns the number of chunks.
+    # model: every batch must come from it (the shard / doc-cache key), see embed_texts
+    stop = threading.Event()
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    vec_q: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    workers = [
+        # copy_context: stage timings land on the request that started the pipeline
+        threading.Thread(target=contextvars.copy_context().run, args=(_chunk_stage, chunks, chunk_q, stop, batch_size), daemon=True),
+        threading.Thread(target=contextvars.copy_context().run, args=(_embed_stage, chunk_q, vec_q, stop, model), daemon=True),
+    ]
+    for w in workers:
+        w.start()
+
+    n = 0
+    try:
+        while True:
+            item = vec_q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.exc
+            batch, vectors = item
+            if sink is not None:
+                sink(batch, vectors)
+            n += len(batch)
+    finally:
+        stop.set()
+        for w in workers:
+            w.join(timeout=1.0)
+    return n
@@ -1,6 +1,9 @@
-import json, os
-from typing import List, Dict, Any
-from .config import OPENAI_API_KEY
+import json, os, time, random, asyncio
+from typing import List, Dict, Any, Optional
+from .config import (OPENAI_API_KEY, LLM_CONCURRENCY, LLM_REQUESTS_PER_MIN, LLM_TOKENS_PER_MIN,
+                     LLM_MAX_RETRIES, LLM_TIMEOUT, LLM_BATCH_QUESTIONS, LLM_BATCH_MAX_QUESTIONS,
+                     LLM_BATCH_MIN_OVERLAP)
+from .metrics import stage
 
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 
@@ -22,6 +25,27 @@ JSON ONLY:
 """.strip()
     return template
 
+def _batch_prompt(questions: List[str], contexts: List[Dict[str, Any]]) -> str:
+    # instructions, then context sorted by chunk id, then the questions: groups over the same
+    # chunks share a byte-identical prefix, which provider-side prompt caching can reuse
+    ctx_text = "\n\n".join([f"[Chunk {c['id']}]\n{c['text']}" for c in sorted(contexts, key=lambda c: str(c["id"]))])
+    q_text = "\n".join([f"{i}. {q}" for i, q in enumerate(questions)])
+    template = f"""
+You are a domain expert (insurance/legal/HR/compliance). Answer each QUESTION using only the CONTEXT.
+If an answer is not explicitly supported, say "Not explicitly stated." Be concise.
+
+Return a STRICT JSON array with one object per question: index (int, the question number), answer (string), reasoning (string, <= 2 sentences), confidence (0..1), citations (array of chunk ids).
+
+CONTEXT:
+{ctx_text}
+
+QUESTIONS:
+{q_text}
+
+JSON ARRAY ONLY:
+""".strip()
+    return template
+
 def _parse_json(content: str) -> Dict[str, Any]:
     try:
         return json.loads(content)
@@ -32,21 +56,230 @@ def _parse_json(content: str) -> Dict[str, Any]:
             return json.loads(m.group(0))
         return {"answer": content, "reasoning": "LLM returned free text.", "confidence": 0.5, "citations": []}
 
+def _parse_batch(content: str, n: int) -> Dict[int, Dict[str, Any]]:
+    # index -> answer for every well-formed entry; anything else is retried on its own
+    try:
+        data = json.loads(content)
+    except Exception:
+        import re
+        m = re.search(r'\[.*\]', content, re.S)
+        try:
+            data = json.loads(m.group(0)) if m else None
+        except Exception:
+            data = None
+    if isinstance(data, dict):
+        data = data.get("answers")
+    if not isinstance(data, list):
+        return {}
+    out = {}
+    for item in data:
+        if not isinstance(item, dict) or not isinstance(item.get("answer"), str):
+            continue
+        idx = item.get("index")
+        if isinstance(idx, int) and 0 <= idx < n and idx not in out:
+            item = {k: v for k, v in item.items() if k != "index"}
+            if not isinstance(item.get("citations", []), list):
+                item["citations"] = []
+            out[idx] = item
+    return out
+
+SYSTEM_MESSAGE = "You reason carefully and cite sources by chunk id."
+MAX_ANSWER_TOKENS = 400  # reserved per call when charging the tokens/min bucket
+
+def _heuristic_answer(contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    text = contexts[0]['text'] if contexts else ""
+    ans = "Not explicitly stated."
+    if any(k in text.lower() for k in ["cover", "covered", "coverage"]):
+        ans = "Possibly covered; conditions may apply. Refer to cited clauses."
+    return {
+        "answer": ans,
+        "reasoning": "OpenAI key not set; returned heuristic answer from local mode.",
+        "confidence": 0.4,
+        "citations": [c["id"] for c in contexts[:2]]
+    }
+
+def _error_answer(e: Exception, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "answer": "Not explicitly stated.",
+        "reasoning": f"LLM error: {e}",
+        "confidence": 0.3,
+        "citations": [c["id"] for c in contexts[:1]],
+        "error": True  # keeps it out of the answer cache
+    }
+
+def _with_defaults(data: Dict[str, Any]) -> Dict[str, Any]:
+    data.setdefault("answer", "Not explicitly stated.")
+    data.setdefault("reasoning", "")
+    data.setdefault("confidence", 0.6)
+    data.setdefault("citations", [])
+    return data
+
+def _messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+class _TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(per_minute, 1))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(float(amount), self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+# One pooled async client + limiters per event loop (uvicorn runs a single loop per worker)
+class _LLMPool:
+    def __init__(self, loop):
+        from openai import AsyncOpenAI
+        self.loop = loop
+        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=LLM_TIMEOUT)
+        self.slots = asyncio.Semaphore(max(LLM_CONCURRENCY, 1))
+        self.requests = _TokenBucket(LLM_REQUESTS_PER_MIN)
+        self.tokens = _TokenBucket(LLM_TOKENS_PER_MIN)
+
+_pool: Optional[_LLMPool] = None
+
+def _get_pool() -> _LLMPool:
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool.loop is not loop:
+        _pool = _LLMPool(loop)
+    return _pool
+
+def _retry_delay(e: Exception, attempt: int) -> Optional[float]:
+    import openai
+    status = getattr(e, "status_code", None)
+    retriable = isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)) or status == 429 or (status or 0) >= 500
+    if not retriable or attempt >= LLM_MAX_RETRIES:
+        return None
+    response = getattr(e, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, 0.5)
+        except ValueError:
+            pass
+    # exponential backoff with full jitter
+    return random.uniform(0, min(20.0, 0.5 * (2 ** attempt)))
+
+async def _achat(prompt: str, answer_tokens: int = MAX_ANSWER_TOKENS) -> str:
+    # one rate-limited completion with retries; raises the last error when retries run out
+    pool = _get_pool()
+    attempt = 0
+    async with pool.slots:
+        while True:
+            await pool.requests.acquire(1)
+            await pool.tokens.acquire(len(prompt) // 4 + answer_tokens)
+            try:
+                with stage("llm") as st:
+                    resp = await pool.client.chat.completions.create(
+                        model=OPENAI_CHAT_MODEL,
+                        temperature=0.2,
+                        messages=_messages(prompt)
+                    )
+                    usage = getattr(resp, "usage", None)
+                    if usage is not None:
+                        st.add(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+                return resp.choices[0].message.content.strip()
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+async def acall_llm(question: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not OPENAI_API_KEY:
+        return _heuristic_answer(contexts)
+    try:
+        data = _parse_json(await _achat(_prompt(question, contexts)))
+    except Exception as e:
+        return _error_answer(e, contexts)
+    return _with_defaults(data)
+
+def _group_questions(contexts_list: List[List[Dict[str, Any]]]) -> List[List[int]]:
+    # greedy: a question joins the first group that already holds most of its chunks
+    groups: List[List[int]] = []
+    group_ids: List[set] = []
+    for i, contexts in enumerate(contexts_list):
+        ids = {c["id"] for c in contexts}
+        for g, gids in zip(groups, group_ids):
+            if len(g) < LLM_BATCH_MAX_QUESTIONS and ids and len(ids & gids) / len(ids) >= LLM_BATCH_MIN_OVERLAP:
+                g.append(i)
+                gids |= ids
+                break
+        else:
+            groups.append([i])
+            group_ids.append(set(ids))
+    return groups
+
+async def _answer_group(questions: List[str], contexts_list: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    if len(questions) == 1:
+        return [await acall_llm(questions[0], contexts_list[0])]
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for contexts in contexts_list:
+        for c in contexts:
+            merged.setdefault(c["id"], c)
+    try:
+        content = await _achat(_batch_prompt(questions, list(merged.values())), MAX_ANSWER_TOKENS * len(questions))
+        parsed = _parse_batch(content, len(questions))
+    except Exception:
+        parsed = {}
+    # malformed or missing entries fall back to one call each
+    missing = [i for i in range(len(questions)) if i not in parsed]
+    retried = await asyncio.gather(*[acall_llm(questions[i], contexts_list[i]) for i in missing])
+    parsed.update(zip(missing, retried))
+    return [_with_defaults(parsed[i]) for i in range(len(questions))]
+
+def _answer_jobs(questions: List[str], contexts_list: List[List[Dict[str, Any]]]):
+    # (question indexes, coroutine returning their answers in that order) per LLM request
+    if not LLM_BATCH_QUESTIONS or not OPENAI_API_KEY or len(questions) < 2:
+        groups = [[i] for i in range(len(questions))]
+    else:
+        groups = _group_questions(contexts_list)
+    return [(g, _answer_group([questions[i] for i in g], [contexts_list[i] for i in g])) for g in groups]
+
+async def answer_all(questions: List[str], contexts_list: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # fan out concurrently; results are put back in question order
+    jobs = _answer_jobs(questions, contexts_list)
+    results = await asyncio.gather(*[coro for _, coro in jobs])
+    out: List[Dict[str, Any]] = [{}] * len(questions)
+    for (g, _), answers in zip(jobs, results):
+        for i, ans in zip(g, answers):
+            out[i] = ans
+    return out
+
+async def iter_answers(questions: List[str], contexts_list: List[List[Dict[str, Any]]]):
+    # yields (question index, answer) as soon as each LLM request finishes
+    async def run(g, coro):
+        return g, await coro
+    tasks = [asyncio.ensure_future(run(g, coro)) for g, coro in _answer_jobs(questions, contexts_list)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            g, answers = await fut
+            for i, ans in zip(g, answers):
+                yield i, ans
+    finally:
+        for t in tasks:
+            t.cancel()  # consumer went away (client disconnected)
+
 def call_llm(question: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
     prompt = _prompt(question, contexts)
 
     # Dev/heuristic mode if no key
     if not OPENAI_API_KEY:
-        text = contexts[0]['text'] if contexts else ""
-        ans = "Not explicitly stated."
-        if any(k in text.lower() for k in ["cover", "covered", "coverage"]):
-            ans = "Possibly covered; conditions may apply. Refer to cited clauses."
-        return {
-            "answer": ans,
-            "reasoning": "OpenAI key not set; returned heuristic answer from local mode.",
-            "confidence": 0.4,
-            "citations": [c["id"] for c in contexts[:2]]
-        }
+        return _heuristic_answer(contexts)
 
     # New SDK only
     try:
@@ -55,24 +288,12 @@ def call_llm(question: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
         resp = client.chat.completions.create(
             model=OPENAI_CHAT_MODEL,
             temperature=0.2,
-            messages=[
-                {"role": "system", "content": "You reason carefully and cite sources by chunk id."},
-                {"role": "user", "content": prompt}
-            ]
+            messages=_messages(prompt)
         )
         content = resp.choices[0].message.content.strip()
         data = _parse_json(content)
     except Exception as e:
-        return {
-            "answer": "Not explicitly stated.",
-            "reasoning": f"LLM error: {e}",
-            "confidence": 0.3,
-            "citations": [c["id"] for c in contexts[:1]]
-        }
+        return _error_answer(e, contexts)
 
     # Safety defaults
-    data.setdefault("answer", "Not explicitly stated.")
-    data.setdefault("reasoning", "")
-    data.setdefault("confidence", 0.6)
-    data.setdefault("citations", [])
-    return data
+    return _with_defaults(data)
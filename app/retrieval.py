@@ -1,24 +1,82 @@
 
-from .embeddings import embed_query
-from .config import TOP_K, SIMILARITY_THRESHOLD, MAX_CONTEXT_CHARS
-
-def retrieve(store, question: str, id_to_text: dict):
-    qvec = embed_query(question)
-    raw = store.search(qvec, top_k=TOP_K)
-    filtered = [(cid, score, meta) for cid, score, meta in raw if score >= SIMILARITY_THRESHOLD]
-    contexts = []
-    for cid, score, meta in filtered:
-        text = (id_to_text.get(cid) or "")[:MAX_CONTEXT_CHARS]
-        contexts.append({
-            "id": cid,
-            "score": float(score),
-            "text": text,
-            "metadata": meta
-        })
-    if not contexts and raw:
-        for cid, score, meta in raw[:2]:
-            text = (id_to_text.get(cid) or "")[:MAX_CONTEXT_CHARS]
+import numpy as np
+from .batcher import embed_queries
+from .config import TOP_K, SIMILARITY_THRESHOLD, MAX_CONTEXT_CHARS, CONTEXT_PACKING, HYBRID_CANDIDATES, RRF_K
+from .context import pack_contexts
+from .metrics import stage
+
+def _score_matrix(raw_rows, k: int) -> np.ndarray:
+    scores = np.full((len(raw_rows), k), -np.inf, dtype="float32")
+    for i, raw in enumerate(raw_rows):
+        if raw:
+            scores[i, :len(raw)] = [score for _, score, _ in raw[:k]]
+    return scores
+
+def _dense_select(raw_rows):
+    scores = _score_matrix(raw_rows, TOP_K)
+    keep = scores >= SIMILARITY_THRESHOLD
+    # rows with nothing above threshold fall back to their best 2 hits
+    empty = ~keep.any(axis=1)
+    keep[empty, :2] = np.isfinite(scores[empty, :2])
+    return [[h for h, ok in zip(raw, row_keep) if ok] for raw, row_keep in zip(raw_rows, keep)]
+
+def _fuse(dense, lexical, k: int):
+    # reciprocal rank fusion of the dense and BM25 rankings; the score is rescaled so a chunk
+    # ranked first in both lists gets 1.0, keeping packing/MMR on their usual 0..1 scale
+    fused = {}
+    for hits in (dense, lexical):
+        for rank, (cid, _, meta) in enumerate(hits):
+            e = fused.setdefault(cid, [0.0, meta])
+            e[0] += 1.0 / (RRF_K + rank + 1)
+    dense_score = {cid: score for cid, score, _ in dense}
+    lexical_ids = {cid for cid, _, _ in lexical}
+    ranked = sorted(fused.items(), key=lambda kv: -kv[1][0])[:k]
+    top = 2.0 / (RRF_K + 1)
+    # a dense-only hit still has to clear the similarity threshold; an exact-term hit does not
+    picked = [(cid, rrf / top, meta) for cid, (rrf, meta) in ranked
+              if cid in lexical_ids or dense_score.get(cid, -1.0) >= SIMILARITY_THRESHOLD]
+    return picked or [(cid, rrf / top, meta) for cid, (rrf, meta) in ranked[:2]]
+
+def retrieve_many(store, questions, id_to_text: dict = None, with_vectors: bool = False, lexical=None):
+    # with_vectors=True also returns the question embeddings (answer cache reuses them);
+    # lexical (a LexicalSearcher) fuses BM25 hits into the dense ranking
+    if not questions:
+        return ([], None) if with_vectors else []
+    # one embedding batch and one multi-query search for all questions
+    with stage("embed_query") as st:
+        qmat = embed_queries(list(questions))
+        st.add(questions=len(questions))
+    hybrid = lexical is not None and lexical.indexes
+    with stage("search"):
+        raw_rows = store.search_many(qmat, top_k=max(TOP_K, HYBRID_CANDIDATES) if hybrid else TOP_K)
+    if hybrid:
+        with stage("lexical"):
+            lexical_rows = lexical.search_many(questions, HYBRID_CANDIDATES)
+        selected = [_fuse(d, l, TOP_K) for d, l in zip(raw_rows, lexical_rows)]
+    else:
+        selected = _dense_select(raw_rows)
+
+    # chunk text comes from the store's mapped text column; id_to_text only backs stores without one
+    wanted = [cid for hits in selected for cid, _, _ in hits]
+    texts = store.get_texts(list(dict.fromkeys(wanted))) if wanted else {}
+
+    out = []
+    for hits in selected:
+        contexts = []
+        for cid, score, meta in hits:
+            text = texts.get(cid) or (id_to_text or {}).get(cid) or ""
             contexts.append({
-                "id": cid, "score": float(score), "text": text, "metadata": meta
+                "id": cid,
+                "score": float(score),
+                "text": text if CONTEXT_PACKING else text[:MAX_CONTEXT_CHARS],
+                "metadata": meta
             })
-    return contexts
+        # merge overlapping neighbours, drop repeated clauses and fit a token budget
+        if CONTEXT_PACKING:
+            with stage("pack"):
+                contexts = pack_contexts(contexts)
+        out.append(contexts)
+    return (out, qmat) if with_vectors else out
+
+def retrieve(store, question: str, id_to_text: dict = None, lexical=None):
+    return retrieve_many(store, [question], id_to_text, lexical=lexical)[0]
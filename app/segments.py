@@ -0,0 +1,142 @@
+
+import os, json, threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+# On-disk layout for one FAISS store `name`:
+#   {name}.manifest.json         -> {"generation", "base", "table", "columns", "segments", "next_seq", "index_kind", "trained_on"}
+#   {name}.gNNNN.index / .table.npz  immutable compacted base (legacy: {name}.index / {name}.table.npz)
+#   {name}.gNNNN.<column>.npy    base columns (chunk text / metadata blobs + offsets), opened with mmap
+#   {name}.seg-NNNNNN.npz        immutable appended vectors + ids + packed metadata + chunk text
+#   {name}.lock                  flock'd by writers across processes
+# Every file is written to a temp name, fsync'd and renamed, and the manifest is renamed last,
+# so readers only ever see complete files from one published snapshot.
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _publish(tmp: str, path: str):
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+def _tmp_name(path: str) -> str:
+    return f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+
+class SegmentLog:
+    def __init__(self, directory: str, name: str):
+        self.dir = directory
+        self.name = name
+        self.manifest_path = os.path.join(directory, f"{name}.manifest.json")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        self._thread_lock = threading.Lock()
+
+    def path(self, fname: str) -> str:
+        return os.path.join(self.dir, fname)
+
+    def read_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        manifest = {"generation": 0, "base": None, "table": None, "segments": [], "next_seq": 0}
+        # pre-manifest layout: a single base written in place
+        if os.path.exists(self.path(f"{self.name}.index")):
+            manifest["base"] = f"{self.name}.index"
+            if os.path.exists(self.path(f"{self.name}.table.npz")):
+                manifest["table"] = f"{self.name}.table.npz"
+        return manifest
+
+    def stamp(self) -> Optional[int]:
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def files(self, manifest: Dict[str, Any]) -> List[str]:
+        names = [manifest.get("base"), manifest.get("table")] + list((manifest.get("columns") or {}).values())
+        names += list(manifest.get("segments", []))
+        return [self.path(n) for n in names if n]
+
+    @contextmanager
+    def locked(self):
+        import fcntl
+        # flock is per open file description, so also serialize threads of this process
+        with self._thread_lock:
+            with open(self.lock_path, "a+") as fh:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def publish_manifest(self, manifest: Dict[str, Any]):
+        tmp = _tmp_name(self.manifest_path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        _publish(tmp, self.manifest_path)
+
+    def read_segment(self, fname: str) -> Dict[str, np.ndarray]:
+        with np.load(self.path(fname)) as seg:
+            return {k: seg[k] for k in seg.files}
+
+    def read_column(self, fname: str) -> np.ndarray:
+        try:
+            return np.load(self.path(fname), mmap_mode="r")
+        except ValueError:
+            return np.load(self.path(fname))  # zero-length arrays cannot be mapped
+
+    def append_segment(self, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        seq = manifest["next_seq"]
+        fname = f"{self.name}.seg-{seq:06d}.npz"
+        path = self.path(fname)
+        tmp = _tmp_name(path)
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        _publish(tmp, path)
+        new = dict(manifest, segments=list(manifest["segments"]) + [fname], next_seq=seq + 1)
+        self.publish_manifest(new)
+        return new
+
+    def write_base(self, manifest: Dict[str, Any], index, table: Dict[str, np.ndarray],
+                   extra: Optional[Dict[str, Any]] = None,
+                   columns: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+        import faiss
+        gen = manifest["generation"] + 1
+        index_name = f"{self.name}.g{gen:04d}.index"
+        table_name = f"{self.name}.g{gen:04d}.table.npz"
+        tmp = _tmp_name(self.path(index_name))
+        faiss.write_index(index, tmp)
+        _publish(tmp, self.path(index_name))
+        tmp = _tmp_name(self.path(table_name))
+        with open(tmp, "wb") as f:
+            np.savez(f, **table)
+        _publish(tmp, self.path(table_name))
+        column_names = {}
+        for col, arr in (columns or {}).items():
+            column_names[col] = f"{self.name}.g{gen:04d}.{col}.npy"
+            tmp = _tmp_name(self.path(column_names[col]))
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(arr))
+            _publish(tmp, self.path(column_names[col]))
+        new = {"generation": gen, "base": index_name, "table": table_name, "columns": column_names,
+               "segments": [], "next_seq": manifest["next_seq"], **(extra or {})}
+        self.publish_manifest(new)
+        # unlinked files stay valid for anyone still mapping them
+        for path in self.files(manifest):
+            if path not in self.files(new):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return new
@@ -1,100 +1,523 @@
 
-import os, json
+import os, json, threading, heapq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Dict, Any, Tuple
-from .config import STORAGE_DIR, VECTOR_MODE, PINECONE_API_KEY, PINECONE_ENV, PINECONE_INDEX
-from .embeddings import embed_texts
+from typing import List, Dict, Any, Tuple, Optional
+from .config import (STORAGE_DIR, VECTOR_MODE, PINECONE_API_KEY, PINECONE_LOCAL,
+                     FAISS_MMAP, FAISS_COMPACT_SEGMENTS, STORE_CACHE_MAX_BYTES, SHARD_SEARCH_WORKERS)
+from .embeddings import embed_texts, embedding_dim, model_slug
+from .segments import SegmentLog
+from .chunkstore import BlobColumn, pack, pack_texts
+from .metrics import stage
+from . import annindex, pinecone_client
 
 class BaseVectorStore:
-    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]]):
+    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]],
+            texts: Optional[List[str]] = None):
         raise NotImplementedError
     def search(self, vector: np.ndarray, top_k: int) -> List[Tuple[str, float, Dict[str, Any]]]:
         raise NotImplementedError
+    def search_many(self, matrix: np.ndarray, top_k: int) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+        return [self.search(v, top_k) for v in matrix]
+    def missing_ids(self, ids: List[str]) -> List[str]:
+        # stores that cannot answer cheaply report everything as missing (upsert is idempotent)
+        return list(ids)
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        # chunk text kept next to the vectors; stores without it return {} and callers fall back
+        return {}
+    def has_texts(self) -> bool:
+        return False
+    def count(self) -> int:
+        # rows the store can vouch for without a round trip; 0 = unknown
+        return 0
+
+def _pack_metas(metas: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    return pack([json.dumps(m, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for m in metas])
 
 class FAISSStore(BaseVectorStore):
     def __init__(self, name: str):
-        import faiss
         self.name = name
         self.dir = os.path.join(STORAGE_DIR, "faiss")
         os.makedirs(self.dir, exist_ok=True)
-        self.index_path = os.path.join(self.dir, f"{name}.index")
-        self.meta_path = os.path.join(self.dir, f"{name}.meta.json")
+        self.log = SegmentLog(self.dir, name)
+        self.meta_path = os.path.join(self.dir, f"{name}.meta.json")  # legacy, read-only
 
         self.index = None
-        self.meta: Dict[str, Dict[str, Any]] = {}
-        self._load_if_exists()
+        self.mmapped = False
+        self._lock = threading.RLock()
+        # FAISS label -> chunk id / metadata / text; labels are dense row numbers 0..n-1
+        self.ids = np.zeros(0, dtype="S1")
+        self.metas = BlobColumn()
+        self.texts = BlobColumn()
+        self._pos: Dict[str, int] = {}
+        self._manifest = self.log.read_manifest()
+        self._stamp = None
+        self._compacting = False
+        self._load()
 
-    def _load_if_exists(self):
+    def _read_index(self, path: str, mmap: bool):
         import faiss
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
-            self.index = faiss.read_index(self.index_path)
-            with open(self.meta_path, "r", encoding="utf-8") as f:
-                self.meta = json.load(f)
+        if mmap:
+            # read-only mmap lets workers serving the same index share the page cache
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            try:
+                return faiss.read_index(path, flags), True
+            except RuntimeError:
+                pass
+        return faiss.read_index(path), False
 
-    def _save(self):
+    def _read_base(self, manifest: Dict[str, Any], mmap: bool):
         import faiss
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, ensure_ascii=False)
+        ids, metas, texts = np.zeros(0, dtype="S1"), BlobColumn(), BlobColumn()
+        if not manifest["base"]:
+            return None, False, ids, metas, texts
+        index, mmapped = self._read_index(self.log.path(manifest["base"]), mmap)
+        annindex.tune(index)
+        if manifest["table"]:
+            with np.load(self.log.path(manifest["table"])) as t:
+                ids = t["ids"]
+                if "meta_blob" in t.files:  # bases written before the column files
+                    metas = BlobColumn.of(t["meta_blob"], t["meta_offsets"], len(ids))
+            cols = {c: self.log.read_column(f) for c, f in (manifest.get("columns") or {}).items()}
+            if "meta_blob" in cols:
+                metas = BlobColumn.of(cols["meta_blob"], cols["meta_offsets"], len(ids))
+            texts = BlobColumn.of(cols.get("text_blob"), cols.get("text_offsets"), len(ids), cols.get("text_present"))
+        elif os.path.exists(self.meta_path):
+            # legacy layout: flat index whose leading rows follow the JSON dict order; later rows
+            # are duplicates from re-adding the same ids, so rebuild an id-mapped index from the head
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            n = min(len(meta), index.ntotal)
+            legacy, index, mmapped = index, faiss.IndexIDMap2(faiss.IndexFlatIP(index.d)), False
+            if n:
+                index.add_with_ids(legacy.reconstruct_n(0, n), np.arange(n, dtype="int64"))
+            ids = np.array([k.encode("utf-8") for k in list(meta.keys())[:n]], dtype="S")
+            metas = BlobColumn.of(*_pack_metas(list(meta.values())[:n]), n)
+            texts = BlobColumn.of(None, None, n)
+        else:
+            return None, False, ids, metas, texts
+        return index, mmapped, ids, metas, texts
 
-    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]]):
+    def _apply_segment(self, index, ids: np.ndarray, metas: BlobColumn, texts: BlobColumn, fname: str):
         import faiss
-        vectors = vectors.astype("float32")
-        dim = vectors.shape[1]
-        if self.index is None:
-            self.index = faiss.IndexFlatIP(dim)  # cosine via normalized vectors
-        self.index.add(vectors)
-        for i, mid in enumerate(ids):
-            self.meta[mid] = metadatas[i]
-        self._save()
+        seg = self.log.read_segment(fname)
+        vectors = np.ascontiguousarray(seg["vectors"], dtype="float32")
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))  # cosine via normalized vectors
+        index.add_with_ids(vectors, seg["labels"])
+        ids = np.concatenate([ids, seg["ids"]])
+        n = len(seg["ids"])
+        metas = metas.extended(seg["meta_blob"], seg["meta_offsets"], n)
+        texts = texts.extended(seg.get("text_blob"), seg.get("text_offsets"), n)
+        return index, ids, metas, texts
 
-    def search(self, vector: np.ndarray, top_k: int):
-        import faiss
-        if self.index is None:
-            return []
-        vector = vector.astype("float32").reshape(1, -1)
-        scores, idx = self.index.search(vector, top_k)
-        results = []
-        keys = list(self.meta.keys())
-        for row, score in zip(idx[0], scores[0]):
-            if row < 0 or row >= len(keys):
+    def _load(self):
+        # a concurrent compaction may delete files named by the manifest we just read; reread and retry
+        for attempt in range(3):
+            stamp = self.log.stamp()
+            manifest = self.log.read_manifest()
+            try:
+                index, mmapped, ids, metas, texts = self._read_base(manifest, FAISS_MMAP and not manifest["segments"])
+                for fname in manifest["segments"]:
+                    index, ids, metas, texts = self._apply_segment(index, ids, metas, texts, fname)
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
                 continue
-            mid = keys[row]
-            results.append((mid, float(score), self.meta[mid]))
-        return results
+            pos = {cid.decode("utf-8"): i for i, cid in enumerate(ids.tolist())}
+            with self._lock:
+                self.index, self.mmapped, self.ids, self.metas, self.texts, self._pos = index, mmapped, ids, metas, texts, pos
+                self._manifest, self._stamp = manifest, stamp
+            return
+
+    def refresh(self, locked: bool = False):
+        # pick up segments/compactions published by other processes; a stat when nothing changed.
+        # Writers holding the log lock pass locked=True: two publishes can share an mtime, so they
+        # always reread the manifest and compare its content before appending or compacting.
+        if not locked and self.log.stamp() == self._stamp:
+            return
+        with self._lock:
+            stamp = self.log.stamp()
+            if not locked and stamp == self._stamp:
+                return
+            manifest = self.log.read_manifest()
+            current = self._manifest
+            if all(manifest.get(k) == current.get(k) for k in ("generation", "base", "next_seq", "segments")):
+                self._stamp = stamp
+                return
+            applied = current["segments"]
+            if (manifest["base"] != current["base"] or manifest["segments"][:len(applied)] != applied
+                    or (self.mmapped and len(manifest["segments"]) > len(applied))):
+                self._load()
+                return
+            start = len(self.ids)
+            try:
+                for fname in manifest["segments"][len(applied):]:
+                    self.index, self.ids, self.metas, self.texts = self._apply_segment(
+                        self.index, self.ids, self.metas, self.texts, fname)
+            except FileNotFoundError:
+                self._load()
+                return
+            for i in range(start, len(self.ids)):
+                self._pos[self.ids[i].decode("utf-8")] = i
+            self._manifest, self._stamp = manifest, stamp
+
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(p) for p in self.log.files(self._manifest) if os.path.exists(p))
+
+    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]],
+            texts: Optional[List[str]] = None):
+        with self.log.locked():
+            self.refresh(locked=True)
+            keep = [i for i, mid in enumerate(ids) if mid not in self._pos]
+            if not keep:
+                return
+            vectors = np.ascontiguousarray(vectors.astype("float32")[keep])
+            new_ids = np.array([ids[i].encode("utf-8") for i in keep], dtype="S")
+            start = len(self.ids)
+            labels = np.arange(start, start + len(keep), dtype="int64")
+            blob, offsets = _pack_metas([metadatas[i] for i in keep])
+            arrays = {"vectors": vectors, "labels": labels, "ids": new_ids, "meta_blob": blob, "meta_offsets": offsets}
+            if texts is not None:
+                arrays["text_blob"], arrays["text_offsets"] = pack_texts([texts[i] for i in keep])
+            # the segment is durable before the in-memory index changes
+            manifest = self.log.append_segment(self._manifest, arrays)
+            with self._lock:
+                if self.mmapped:
+                    self.index, self.mmapped = annindex.tune(self._read_index(self.log.path(self._manifest["base"]), False)[0]), False
+                if self.index is None:
+                    import faiss
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))  # cosine via normalized vectors
+                self.index.add_with_ids(vectors, labels)
+                self.ids = np.concatenate([self.ids, new_ids])
+                self.metas = self.metas.extended(blob, offsets, len(keep))
+                self.texts = self.texts.extended(arrays.get("text_blob"), arrays.get("text_offsets"), len(keep))
+                for i, mid in enumerate(new_ids.tolist()):
+                    self._pos[mid.decode("utf-8")] = start + i
+                self._manifest, self._stamp = manifest, self.log.stamp()
+        # a first ingest gets its base right away so later opens can be mmapped
+        if not manifest["base"] or len(manifest["segments"]) >= FAISS_COMPACT_SEGMENTS:
+            self._schedule_compaction()
+
+    def _schedule_compaction(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, name=f"compact-{self.name}", daemon=True).start()
+
+    def compact(self):
+        # fold segments into a new base generation; readers keep their snapshot until the manifest flips
+        try:
+            with self.log.locked():
+                self.refresh(locked=True)
+                snap = self._manifest
+                if not snap["segments"] or self.index is None:
+                    return
+                with self._lock:
+                    index = self.index
+                kind, trained_on = snap.get("index_kind", "flat"), snap.get("trained_on", 0)
+                target = annindex.choose_kind(index.ntotal)
+                # switch layout as the corpus grows; any trained layout (IVF lists, HNSW's SQ8 ranges) is
+                # retrained once it is 4x its training size, or early batches would fix it for good
+                retrain = target != kind or (kind != "flat" and index.ntotal > 4 * trained_on)
+                vectors = self._float_vectors(snap, index) if retrain or target != "flat" else None
+                if not retrain:
+                    self._write_base(index, kind, trained_on, vectors)
+                    return
+            # training can take minutes on a big store, so it runs on the snapshot without the lock
+            rebuilt = annindex.build(target, vectors, np.arange(len(vectors), dtype="int64"))
+            trained_on = len(vectors)
+            with self.log.locked():
+                self.refresh(locked=True)
+                current = self._manifest
+                if (current.get("generation") != snap.get("generation")
+                        or current["segments"][:len(snap["segments"])] != snap["segments"]):
+                    return  # another process compacted meanwhile
+                # replay the segments appended while training
+                newer = [self.log.read_segment(f) for f in current["segments"][len(snap["segments"]):]]
+                for seg in newer:
+                    rebuilt.add_with_ids(np.ascontiguousarray(seg["vectors"], dtype="float32"), seg["labels"])
+                vectors = np.concatenate([vectors] + [seg["vectors"] for seg in newer])
+                self._write_base(rebuilt, target, trained_on, vectors)
+        finally:
+            self._compacting = False
+
+    def _float_vectors(self, manifest: Dict[str, Any], index) -> np.ndarray:
+        # original float32 rows in label order; quantized layouts keep them in a "vectors" column so
+        # a rebuild never trains on decoded approximations (the error would compound every retrain)
+        cols = manifest.get("columns") or {}
+        if manifest.get("index_kind", "flat") == "flat" or "vectors" not in cols:
+            return annindex.vectors_of(index)[1]  # exact for flat; bases from before the column: best effort
+        parts = [self.log.read_column(cols["vectors"])]
+        parts += [self.log.read_segment(f)["vectors"] for f in manifest["segments"]]
+        return np.concatenate(parts).astype("float32", copy=False)
+
+    def _write_base(self, index, kind: str, trained_on: int, vectors: Optional[np.ndarray]):
+        # caller holds the log lock and has refreshed, so ids/metas/texts match the index rows
+        with self._lock:
+            ids, metas, texts = self.ids, self.metas, self.texts
+        meta_blob, meta_offsets, _ = metas.packed()
+        text_blob, text_offsets, present = texts.packed()
+        columns = {"meta_blob": meta_blob, "meta_offsets": meta_offsets,
+                   "text_blob": text_blob, "text_offsets": text_offsets}
+        if present is not None:
+            columns["text_present"] = present
+        if kind != "flat":
+            columns["vectors"] = np.ascontiguousarray(vectors, dtype="float32")
+        manifest = self.log.write_base(self._manifest, index, {"ids": ids},
+                                       {"index_kind": kind, "trained_on": trained_on}, columns)
+        # swap the in-memory columns for maps of the files just written
+        cols = {c: self.log.read_column(f) for c, f in manifest["columns"].items()}
+        with self._lock:
+            self.index = index
+            self.metas = BlobColumn.of(cols["meta_blob"], cols["meta_offsets"], len(ids))
+            self.texts = BlobColumn.of(cols["text_blob"], cols["text_offsets"], len(ids), cols.get("text_present"))
+            self._manifest, self._stamp = manifest, self.log.stamp()
+
+    def missing_ids(self, ids: List[str]) -> List[str]:
+        return [i for i in ids if i not in self._pos]
 
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        with self._lock:
+            pos, texts = self._pos, self.texts
+        out = {}
+        for cid in ids:
+            row = pos.get(cid)
+            text = texts.text(row) if row is not None else None
+            if text is not None:
+                out[cid] = text
+        return out
+
+    def has_texts(self) -> bool:
+        with self._lock:
+            return len(self.texts) == len(self.ids) and self.texts.complete()
+
+    def count(self) -> int:
+        self.refresh()
+        return len(self.ids)
+
+    def search(self, vector: np.ndarray, top_k: int):
+        return self.search_many(vector.reshape(1, -1), top_k)[0]
+
+    def search_many(self, matrix: np.ndarray, top_k: int):
+        with self._lock:
+            if self.index is None:
+                return [[] for _ in range(len(matrix))]
+            # one FAISS call for every query row
+            matrix = np.ascontiguousarray(matrix, dtype="float32").reshape(len(matrix), -1)
+            scores, idx = self.index.search(matrix, top_k)
+            ids, metas = self.ids, self.metas
+        n = len(ids)
+        out = []
+        for labels, row_scores in zip(idx, scores):
+            valid = (labels >= 0) & (labels < n)
+            labels, row_scores = labels[valid], row_scores[valid]
+            out.append([(ids[l].decode("utf-8"), float(sc), json.loads(metas.get(l)))
+                        for l, sc in zip(labels.tolist(), row_scores.tolist())])
+        return out
+
+# One namespace per document shard (doc_<content hash>) inside a single shared index
 class PineconeStore(BaseVectorStore):
     def __init__(self, name: str):
-        import pinecone
-        pinecone.init(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
-        self.index_name = PINECONE_INDEX or (name + "-index")
-        existing = [i.name for i in pinecone.list_indexes()]
-        if self.index_name not in existing:
-            pinecone.create_index(self.index_name, dimension=384, metric="cosine")
-        self.index = pinecone.Index(self.index_name)
-
-    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]]):
-        vecs = vectors.tolist()
-        to_upsert = list(zip(ids, vecs, metadatas))
-        self.index.upsert(vectors=to_upsert)
+        self.name = name
+        self.namespace = name
+        self.index = pinecone_client.get_index(embedding_dim())
+        self._present = set()  # ids known to be upserted, saves fetches on re-ingest
+
+    def missing_ids(self, ids: List[str]) -> List[str]:
+        todo = [i for i in ids if i not in self._present]
+        if not todo or pinecone_client.namespace_count(self.index, self.namespace) == 0:
+            return todo
+        found = pinecone_client.fetch_ids(self.index, todo, self.namespace)
+        self._present.update(found)
+        return [i for i in todo if i not in found]
+
+    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]],
+            texts: Optional[List[str]] = None):
+        # split by count and request size, sent in parallel with retries
+        pinecone_client.upsert_batched(self.index, list(zip(ids, vectors.tolist(), metadatas)), self.namespace)
+        self._present.update(ids)
 
     def search(self, vector: np.ndarray, top_k: int):
-        res = self.index.query(vector=vector.tolist(), top_k=top_k, include_metadata=True)
+        res = self.index.query(vector=vector.tolist(), top_k=top_k, include_metadata=True, namespace=self.namespace)
         out = []
         for m in res.matches or []:
             out.append((m.id, float(m.score), m.metadata or {}))
         return out
 
+    def search_many(self, matrix: np.ndarray, top_k: int):
+        # Pinecone queries one vector per request; issue them in parallel
+        if len(matrix) <= 1:
+            return [self.search(v, top_k) for v in matrix]
+        with ThreadPoolExecutor(max_workers=min(8, len(matrix))) as ex:
+            return list(ex.map(lambda v: self.search(v, top_k), matrix))
+
+# Searches several shards (one per document) in parallel and k-way merges their sorted hits
+class FederatedStore(BaseVectorStore):
+    def __init__(self, shards: List[BaseVectorStore]):
+        self.shards = shards
+
+    def add(self, ids: List[str], vectors: np.ndarray, metadatas: List[Dict[str, Any]],
+            texts: Optional[List[str]] = None):
+        raise NotImplementedError("add to a document shard, not the federated view")
+
+    def get_texts(self, ids: List[str]) -> Dict[str, str]:
+        out = {}
+        for st in self.shards:
+            out.update(st.get_texts([i for i in ids if i not in out]))
+        return out
+
+    def has_texts(self) -> bool:
+        return all(st.has_texts() for st in self.shards)
+
+    def search(self, vector: np.ndarray, top_k: int):
+        return self.search_many(vector.reshape(1, -1), top_k)[0]
+
+    def search_many(self, matrix: np.ndarray, top_k: int):
+        per_shard = list(_shard_pool().map(lambda st: st.search_many(matrix, top_k), self.shards))
+        out = []
+        for q in range(len(matrix)):
+            merged, seen = [], set()
+            for hit in heapq.merge(*[rows[q] for rows in per_shard], key=lambda h: -h[1]):
+                if hit[0] in seen:
+                    continue
+                seen.add(hit[0])
+                merged.append(hit)
+                if len(merged) >= top_k:
+                    break
+            out.append(merged)
+        return out
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _shard_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search")
+        return _pool
+
+def shard_name(content_hash: str, model: Optional[str] = None) -> str:
+    # vectors from different embedder models never share a shard
+    return f"doc_{content_hash}_{model_slug(model)}"
+
+# Process-wide LRU of opened FAISS stores, bounded by their on-disk size
+class StoreRegistry:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._stores: "OrderedDict[str, FAISSStore]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, name: str) -> FAISSStore:
+        with self._lock:
+            store = self._stores.get(name)
+            if store is not None:
+                self._stores.move_to_end(name)
+                self.stats["hits"] += 1
+        if store is not None:
+            store.refresh()
+            return store
+        with self._lock:
+            self.stats["misses"] += 1
+        store = FAISSStore(name=name)
+        with self._lock:
+            # another thread may have opened it meanwhile; keep the first one
+            existing = self._stores.get(name)
+            if existing is not None:
+                self._stores.move_to_end(name)
+                return existing
+            self._stores[name] = store
+            self._sizes[name] = store.nbytes()
+            self._bytes += self._sizes[name]
+            self._evict(keep=name)
+        return store
+
+    def update_size(self, name: str):
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                return
+            size = store.nbytes()
+            self._bytes += size - self._sizes.get(name, 0)
+            self._sizes[name] = size
+            self._evict(keep=name)
+
+    def _evict(self, keep: str):
+        while self._bytes > self.max_bytes and len(self._stores) > 1:
+            name = next(iter(self._stores))
+            if name == keep:
+                self._stores.move_to_end(name)
+                name = next(iter(self._stores))
+            self._stores.pop(name)
+            self._bytes -= self._sizes.pop(name, 0)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            names = [name] if name is not None else list(self._stores)
+            for n in names:
+                if self._stores.pop(n, None) is not None:
+                    self._bytes -= self._sizes.pop(n, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, stores=len(self._stores), bytes=self._bytes)
+
+_registry = StoreRegistry(STORE_CACHE_MAX_BYTES)
+
+def store_cache_stats() -> Dict[str, int]:
+    return _registry.snapshot()
+
+def invalidate_store(name: Optional[str] = None):
+    _registry.invalidate(name)
+
+_pinecone_stores: "OrderedDict[str, PineconeStore]" = OrderedDict()
+_pinecone_lock = threading.Lock()
+
+def _pinecone_store(name: str) -> PineconeStore:
+    # the index handle is shared; the per-namespace objects only carry the known-ids set
+    with _pinecone_lock:
+        store = _pinecone_stores.get(name)
+        if store is None:
+            store = _pinecone_stores[name] = PineconeStore(name=name)
+            while len(_pinecone_stores) > 1024:
+                _pinecone_stores.popitem(last=False)
+        _pinecone_stores.move_to_end(name)
+        return store
+
 def get_store(name: str) -> BaseVectorStore:
-    if VECTOR_MODE == "pinecone" and PINECONE_API_KEY:
-        return PineconeStore(name=name)
-    return FAISSStore(name=name)
+    if VECTOR_MODE == "pinecone" and (PINECONE_API_KEY or PINECONE_LOCAL):
+        return _pinecone_store(name)
+    return _registry.get(name)
+
+def get_shards(content_hashes: List[str]) -> BaseVectorStore:
+    stores = [get_store(shard_name(h)) for h in dict.fromkeys(content_hashes)]
+    return stores[0] if len(stores) == 1 else FederatedStore(stores)
 
-def upsert_chunks(name: str, chunks: List[Dict[str, Any]]):
+def add_chunks(store: BaseVectorStore, chunks: List[Dict[str, Any]], vectors: np.ndarray = None):
+    missing = set(store.missing_ids([c["id"] for c in chunks]))
+    keep = [i for i, c in enumerate(chunks) if c["id"] in missing]
+    if not keep:
+        return store
+    chunks = [chunks[i] for i in keep]
     ids = [c["id"] for c in chunks]
-    texts = [c["text"] for c in chunks]
     metas = [c["metadata"] for c in chunks]
-    vecs = embed_texts(texts)
-    store = get_store(name)
-    store.add(ids, vecs, metas)
+    if vectors is None:
+        vecs = embed_texts([c["text"] for c in chunks])
+    else:
+        vecs = vectors[keep]
+    with stage("upsert") as st:
+        store.add(ids, vecs, metas, [c["text"] for c in chunks])
+        st.add(chunks=len(ids))
+    if isinstance(store, FAISSStore):
+        _registry.update_size(store.name)
     return store
+
+def upsert_chunks(name: str, chunks: List[Dict[str, Any]], vectors: np.ndarray = None):
+    return add_chunks(get_store(name), chunks, vectors)
@@ -0,0 +1,55 @@
+
+import os, re, time, threading
+from typing import Dict, Any, List
+from .config import STORAGE_DIR, WARMUP_EMBEDDER, PRELOAD_INDEXES
+
+_state: Dict[str, Any] = {"ready": False, "failed": False, "started": None, "steps": {}, "errors": []}
+_lock = threading.Lock()
+
+def _discover_indexes() -> List[str]:
+    faiss_dir = os.path.join(STORAGE_DIR, "faiss")
+    if not os.path.isdir(faiss_dir):
+        return []
+    names = set()
+    for fname in os.listdir(faiss_dir):
+        m = re.match(r"^(.+?)(?:\.g\d{4})?\.(?:manifest\.json|index)$", fname)
+        if m:
+            names.add(m.group(1))
+    return sorted(names)
+
+def _step(name: str, fn):
+    t0 = time.perf_counter()
+    try:
+        fn()
+        ok = True
+    except Exception as e:
+        ok = False
+        with _lock:
+            _state["errors"].append(f"{name}: {e}")
+    with _lock:
+        _state["steps"][name] = {"ok": ok, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+def run_warmup():
+    from .embeddings import warm_up
+    from .vectorstore import get_store
+    with _lock:
+        _state["started"] = time.time()
+    if WARMUP_EMBEDDER:
+        _step("embedder", warm_up)
+    names = _discover_indexes() if PRELOAD_INDEXES == ["*"] else PRELOAD_INDEXES
+    for name in names:
+        _step(f"index:{name}", lambda n=name: get_store(n))
+    # failed steps are reported but do not hold readiness back; requests fall back to lazy loading
+    with _lock:
+        _state["ready"] = True
+
+def record_failure(exc: BaseException):
+    # run_warmup itself died (not a single step): stay unready and say why
+    with _lock:
+        _state["failed"] = True
+        _state["errors"].append(f"warmup: {type(exc).__name__}: {exc}")
+
+def readiness() -> Dict[str, Any]:
+    with _lock:
+        return {"ready": _state["ready"], "failed": _state["failed"], "steps": dict(_state["steps"]),
+                "errors": list(_state["errors"])}
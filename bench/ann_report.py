@@ -0,0 +1,116 @@
+
+import os, sys, json, time, argparse, platform, tempfile
+
+# Recall-vs-latency report for the ANN layouts in app/annindex.py against the exact flat scan.
+#   python bench/ann_report.py --synthetic 200000 --dim 384
+#   python bench/ann_report.py --store doc_<hash>_<model>    (vectors of an existing FAISS store)
+#   python bench/ann_report.py --synthetic 20000 --incremental --kinds hnsw,ivf_sq --min-recall 0.9
+# --incremental adds the vectors to a fresh FAISSStore in EMBED_BATCH_SIZE batches, compacting as
+# ingest does, so a layout trained on the first batches and never retrained shows up as lost recall.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def parse_args():
+    p = argparse.ArgumentParser(description="ANN recall vs latency")
+    p.add_argument("--store", default="", help="FAISS store name under STORAGE_DIR/faiss")
+    p.add_argument("--synthetic", type=int, default=100000, help="clustered random vectors when no --store")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--kinds", default="hnsw,ivf_sq,ivf_pq")
+    p.add_argument("--nprobe", type=_ints, default=[1, 4, 16, 64])
+    p.add_argument("--ef-search", type=_ints, default=[16, 32, 64, 128])
+    p.add_argument("--incremental", action="store_true", help="build through FAISSStore batch by batch")
+    p.add_argument("--min-recall", type=float, default=0.0, help="--incremental: exit 1 if any layout is below this")
+    p.add_argument("--out", default="ann_report.json")
+    return p.parse_args()
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)).astype("float32")
+
+def synthetic(n: int, d: int, seed: int = 0) -> np.ndarray:
+    # topic clusters rather than uniform noise, closer to how chunk embeddings are distributed
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, n // 500), d)).astype("float32")
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, d)).astype("float32")
+    return _normalize(x)
+
+def store_vectors(name: str) -> np.ndarray:
+    from app.vectorstore import FAISSStore
+    from app import annindex
+    store = FAISSStore(name)
+    if store.index is None:
+        raise SystemExit(f"store {name} is empty")
+    return annindex.vectors_of(store.index)[1]
+
+def incremental_report(vectors: np.ndarray, queries: np.ndarray, k: int, kinds):
+    # recall@k of each layout as a shard ends up after a batch-by-batch ingest, against the exact scan
+    from app import annindex
+    from app.config import EMBED_BATCH_SIZE, FAISS_EF_SEARCH, FAISS_NPROBE
+    from app.vectorstore import FAISSStore
+    labels = np.arange(len(vectors), dtype="int64")
+    _, truth = annindex.build("flat", vectors, labels).search(queries, k)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    rows = []
+    for kind in kinds:
+        annindex.FAISS_INDEX = kind  # choose_kind reads it per call
+        store = FAISSStore(f"incremental_{kind}")
+        t0 = time.perf_counter()
+        for i in range(0, len(vectors), EMBED_BATCH_SIZE):
+            store.add(ids[i:i + EMBED_BATCH_SIZE], vectors[i:i + EMBED_BATCH_SIZE], [{}] * len(ids[i:i + EMBED_BATCH_SIZE]))
+            while store._compacting:  # let each scheduled compaction land, as it would between documents
+                time.sleep(0.01)
+        build_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        found = store.search_many(queries, k)
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        hits = sum(len({int(mid[1:]) for mid, _, _ in f} & set(t)) for f, t in zip(found, truth))
+        manifest = store._manifest
+        built = manifest.get("index_kind", "flat")
+        rows.append({"kind": built, "spec": annindex.factory_spec(built, manifest.get("trained_on", 0), vectors.shape[1]),
+                     "param": {"ef_search": FAISS_EF_SEARCH} if kind == "hnsw" else {"nprobe": FAISS_NPROBE},
+                     "recall": round(hits / truth.size, 4), "query_ms": round(ms, 4), "build_s": round(build_s, 3),
+                     "bytes_per_vector": round(annindex.bytes_per_vector(store.index), 1), "trained_on": manifest.get("trained_on", 0), "segments": len(manifest["segments"])})
+    return rows
+
+def main():
+    args = parse_args()
+    if args.incremental:
+        if args.store:
+            raise SystemExit("--incremental builds its own store; use --synthetic")
+        os.environ["STORAGE_DIR"] = tempfile.mkdtemp(prefix="ann-incremental-")
+    from app import annindex
+    vectors = store_vectors(args.store) if args.store else synthetic(args.synthetic, args.dim)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    # queries near (not on) stored vectors, like a paraphrased question
+    queries = _normalize(vectors[picks] + 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype("float32"))
+    if args.incremental:
+        rows = incremental_report(vectors, queries, args.k, args.kinds.split(","))
+    else:
+        rows = annindex.recall_report(vectors, queries, k=args.k, kinds=args.kinds.split(","),
+                                      nprobes=args.nprobe, ef_searches=args.ef_search)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+    print(f"{'spec':<18} {'param':<16} {'recall':>7} {'ms/query':>9} {'bytes/vec':>10} {'build s':>8}")
+    for r in rows:
+        param = ",".join(f"{k}={v}" for k, v in (r["param"] or {}).items())
+        print(f"{r['spec']:<18} {param:<16} {r['recall']:>7.3f} {r['query_ms']:>9.4f} {r['bytes_per_vector']:>10.1f} {r['build_s']:>8.2f}")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+                            "cpu_count": os.cpu_count(), "vectors": len(vectors), "dim": int(vectors.shape[1]),
+                            "queries": len(queries), "k": args.k, "source": args.store or "synthetic",
+                            "incremental": args.incremental},
+                   "rows": rows}, f, indent=2)
+    print(f"\nwrote {args.out}")
+    low = [r["kind"] for r in rows if r["recall"] < args.min_recall]
+    if low:
+        raise SystemExit(f"recall@{args.k} below {args.min_recall}: {', '.join(low)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+
+import sys, json, time, types, asyncio, hashlib
+import numpy as np
+
+# Deterministic stand-ins for sentence-transformers, OpenAI and Pinecone so the benchmark
+# never touches the network. Installed into sys.modules before the app is imported.
+
+EMBED_DIM = 384
+
+def _hash_vector(text: str, dim: int = EMBED_DIM) -> np.ndarray:
+    # bag of hashed words: similar wording -> similar vectors, so retrieval still behaves
+    v = np.zeros(dim, dtype="float32")
+    for w in text.lower().split():
+        v[int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=4).digest(), "little") % dim] += 1.0
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+def _embed(texts, base_ms: float, per_text_ms: float) -> np.ndarray:
+    time.sleep((base_ms + per_text_ms * len(texts)) / 1000.0)
+    return np.stack([_hash_vector(t) for t in texts]) if texts else np.zeros((0, EMBED_DIM), dtype="float32")
+
+def _answer_for(prompt: str) -> str:
+    digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=4).hexdigest()
+    chunk_ids = [line[len("[Chunk "):].split(" ")[0].rstrip("]") for line in prompt.splitlines() if line.startswith("[Chunk ")]
+    one = lambda: {"answer": f"Synthetic answer {digest}.", "reasoning": "Benchmark fake.",
+                   "confidence": 0.9, "citations": chunk_ids[:2]}
+    if "QUESTIONS:" in prompt:
+        block = prompt.split("QUESTIONS:", 1)[1].split("JSON ARRAY ONLY:", 1)[0]
+        n = sum(1 for line in block.splitlines() if line.strip())
+        return json.dumps([dict(one(), index=i) for i in range(n)])
+    return json.dumps(one())
+
+def _completion(prompt: str):
+    content = _answer_for(prompt)
+    usage = types.SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+def _prompt_of(messages) -> str:
+    return "\n".join(m.get("content", "") for m in messages)
+
+def install(embed_base_ms: float = 2.0, embed_per_text_ms: float = 0.2, llm_ms: float = 300.0,
+            llm_per_token_ms: float = 0.0, pinecone_ms: float = 5.0):
+    # --- sentence-transformers ---
+    st = types.ModuleType("sentence_transformers")
+
+    class SentenceTransformer:
+        def __init__(self, name, *a, **kw):
+            self.name = name
+
+        def get_sentence_embedding_dimension(self):
+            return EMBED_DIM
+
+        def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, **kw):
+            return _embed(list(texts), embed_base_ms, embed_per_text_ms)
+
+    st.SentenceTransformer = SentenceTransformer
+    sys.modules["sentence_transformers"] = st
+
+    # --- openai ---
+    oa = types.ModuleType("openai")
+
+    class APIConnectionError(Exception):
+        pass
+
+    class APITimeoutError(APIConnectionError):
+        pass
+
+    class _Embeddings:
+        def create(self, model, input):
+            vecs = _embed(list(input), embed_base_ms, embed_per_text_ms)
+            return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=v.tolist()) for v in vecs])
+
+    class _SyncCompletions:
+        def create(self, model, messages, **kw):
+            prompt = _prompt_of(messages)
+            time.sleep((llm_ms + llm_per_token_ms * len(prompt) / 4) / 1000.0)
+            return _completion(prompt)
+
+    class _AsyncCompletions:
+        async def create(self, model, messages, **kw):
+            prompt = _prompt_of(messages)
+            await asyncio.sleep((llm_ms + llm_per_token_ms * len(prompt) / 4) / 1000.0)
+            return _completion(prompt)
+
+    class OpenAI:
+        def __init__(self, *a, **kw):
+            self.chat = types.SimpleNamespace(completions=_SyncCompletions())
+            self.embeddings = _Embeddings()
+
+    class AsyncOpenAI:
+        def __init__(self, *a, **kw):
+            self.chat = types.SimpleNamespace(completions=_AsyncCompletions())
+
+    oa.OpenAI, oa.AsyncOpenAI = OpenAI, AsyncOpenAI
+    oa.APIConnectionError, oa.APITimeoutError = APIConnectionError, APITimeoutError
+    sys.modules["openai"] = oa
+
+    # --- pinecone (client 3+ surface over the app's in-memory index, plus request latency) ---
+    from app.pinecone_client import MemoryIndex
+    pc = types.ModuleType("pinecone")
+    indexes = {}
+
+    class Index:
+        def __init__(self, name):
+            self.inner = indexes[name]
+
+        def __getattr__(self, attr):
+            call = getattr(self.inner, attr)
+            def timed(*a, **kw):
+                time.sleep(pinecone_ms / 1000.0)
+                return call(*a, **kw)
+            return timed
+
+    class _IndexList(list):
+        def names(self):
+            return [i.name for i in self]
+
+    class Pinecone:
+        def __init__(self, api_key=None, **kw):
+            pass
+
+        def list_indexes(self):
+            return _IndexList(types.SimpleNamespace(name=n) for n in indexes)
+
+        def create_index(self, name, dimension, metric="cosine", spec=None, **kw):
+            indexes.setdefault(name, MemoryIndex(dimension))
+
+        def describe_index(self, name):
+            return types.SimpleNamespace(name=name, dimension=indexes[name].dimension)
+
+        def Index(self, name):
+            return Index(name)
+
+    pc.Pinecone = Pinecone
+    pc.ServerlessSpec = lambda cloud, region: types.SimpleNamespace(cloud=cloud, region=region)
+    sys.modules["pinecone"] = pc
@@ -0,0 +1,190 @@
+
+import os, sys, json, math, time, asyncio, argparse, platform, functools, itertools, subprocess, tempfile, threading, http.server
+
+# Offline end-to-end benchmark for POST /api/v1/hackrx/run.
+#   python bench/run_bench.py --kinds pdf,docx --pages 5,50 --questions 10 --concurrency 1,4
+# Synthetic documents are served from a local HTTP server; OpenAI, Pinecone and the sentence
+# embedder are deterministic fakes with configurable latency (bench/fakes.py). Each scenario
+# ingests a fresh document once (cold) and then replays the request under load (warm).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Offline /hackrx/run benchmark")
+    p.add_argument("--kinds", default="pdf,docx,eml", help="document formats: pdf,docx,eml")
+    p.add_argument("--pages", type=_ints, default=[5, 50], help="document sizes in pages (~2.4k chars each)")
+    p.add_argument("--questions", type=_ints, default=[10], help="questions per request")
+    p.add_argument("--concurrency", type=_ints, default=[1, 4], help="in-flight requests")
+    p.add_argument("--requests", type=int, default=8, help="warm requests per scenario")
+    p.add_argument("--llm-ms", type=float, default=300.0, help="fake chat completion latency")
+    p.add_argument("--llm-per-token-ms", type=float, default=0.0, help="extra fake latency per prompt token")
+    p.add_argument("--embed-ms", type=float, default=2.0, help="fake embedder latency per call")
+    p.add_argument("--embed-per-text-ms", type=float, default=0.2, help="fake embedder latency per text")
+    p.add_argument("--pinecone-ms", type=float, default=5.0, help="fake Pinecone latency per call")
+    p.add_argument("--llm-tpm", type=int, default=10 ** 9, help="LLM_TOKENS_PER_MIN (default: effectively unlimited)")
+    p.add_argument("--llm-rpm", type=int, default=10 ** 9, help="LLM_REQUESTS_PER_MIN (default: effectively unlimited)")
+    p.add_argument("--vector-mode", choices=["faiss", "pinecone"], default="faiss")
+    p.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (warm runs then skip the LLM)")
+    p.add_argument("--llm-batch", action="store_true", help="enable LLM_BATCH_QUESTIONS")
+    p.add_argument("--storage-dir", default="", help="default: a fresh temp dir")
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--baseline", default="", help="earlier results JSON to compare p50s against")
+    return p.parse_args()
+
+def configure(args):
+    # the app reads its config at import time, so this runs before anything from app/ is imported
+    os.environ["STORAGE_DIR"] = args.storage_dir or tempfile.mkdtemp(prefix="bench-storage-")
+    os.environ["OPENAI_API_KEY"] = "bench-fake"
+    os.environ["EMBEDDER"] = "sentence"
+    os.environ["VECTOR_MODE"] = args.vector_mode
+    if args.vector_mode == "pinecone":
+        os.environ["PINECONE_API_KEY"] = "bench-fake"
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ["LLM_BATCH_QUESTIONS"] = "true" if args.llm_batch else "false"
+    os.environ["METRICS_ENABLED"] = "true"
+    # the client-side rate limiter would otherwise dominate long runs against a zero-cost fake
+    os.environ["LLM_TOKENS_PER_MIN"] = str(args.llm_tpm)
+    os.environ["LLM_REQUESTS_PER_MIN"] = str(args.llm_rpm)
+    from bench import fakes
+    fakes.install(embed_base_ms=args.embed_ms, embed_per_text_ms=args.embed_per_text_ms, llm_ms=args.llm_ms,
+                  llm_per_token_ms=args.llm_per_token_ms, pinecone_ms=args.pinecone_ms)
+
+def serve(directory: str):
+    class Quiet(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Quiet, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def percentiles(values):
+    if not values:
+        return {}
+    xs = sorted(values)
+    pick = lambda q: xs[min(len(xs) - 1, max(0, math.ceil(q * len(xs)) - 1))]  # nearest rank
+    return {"p50": round(pick(0.50), 2), "p90": round(pick(0.90), 2), "p99": round(pick(0.99), 2),
+            "mean": round(sum(xs) / len(xs), 2), "min": round(xs[0], 2), "max": round(xs[-1], 2), "n": len(xs)}
+
+def parse_server_timing(header: str):
+    stages = {}
+    for part in filter(None, (p.strip() for p in (header or "").split(","))):
+        name, _, rest = part.partition(";")
+        for attr in rest.split(";"):
+            if attr.startswith("dur="):
+                stages[name] = float(attr[4:])
+    return stages
+
+async def timed_request(client, headers, body, debug=False):
+    t0 = time.perf_counter()
+    r = await client.post("/api/v1/hackrx/run" + ("?debug=true" if debug else ""), json=body, headers=headers)
+    latency = (time.perf_counter() - t0) * 1000
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP {r.status_code}: {r.text[:200]}")
+    return latency, parse_server_timing(r.headers.get("server-timing", "")), r.json()
+
+async def run_scenario(client, headers, base_url, docs_dir, kind, pages, n_questions, concurrency, n_requests, seed):
+    from bench import synth
+    t0 = time.perf_counter()
+    name = synth.write_document(docs_dir, kind, pages, seed)
+    generate_ms = (time.perf_counter() - t0) * 1000
+    body = {"documents": f"{base_url}/{name}", "questions": synth.questions(pages, seed, n_questions)}
+
+    cold_ms, cold_stages, cold = await timed_request(client, headers, body, debug=True)
+    doc = cold["documents"][0]
+    chunks, size = doc["chunks"], doc.get("fetch", {}).get("bytes", 0)
+
+    sem = asyncio.Semaphore(concurrency)
+    async def one():
+        async with sem:
+            return await timed_request(client, headers, body)
+    t0 = time.perf_counter()
+    warm = await asyncio.gather(*[one() for _ in range(n_requests)])
+    wall = time.perf_counter() - t0
+
+    stage_names = sorted({s for _, stages, _ in warm for s in stages})
+    return {
+        "key": f"{kind}/{pages}p/{n_questions}q/c{concurrency}",
+        "kind": kind, "pages": pages, "questions": n_questions, "concurrency": concurrency,
+        "requests": n_requests, "document_bytes": size, "chunks": chunks,
+        "generate_ms": round(generate_ms, 1),
+        "cold": {
+            "latency_ms": round(cold_ms, 2),
+            "stages_ms": cold_stages,
+            "pages_per_s": round(pages / (cold_ms / 1000), 2),
+            "chunks_per_s": round(chunks / (cold_ms / 1000), 2),
+            "mb_per_s": round(size / 1e6 / (cold_ms / 1000), 3),
+        },
+        "warm": {
+            "latency_ms": percentiles([lat for lat, _, _ in warm]),
+            "stages_ms": {s: percentiles([st[s] for _, st, _ in warm if s in st]) for s in stage_names},
+            "requests_per_s": round(n_requests / wall, 3),
+            "questions_per_s": round(n_requests * n_questions / wall, 3),
+        },
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = {s["key"]: s for s in json.load(f)["scenarios"]}
+    print("\nvs baseline (p50, negative = faster):")
+    for s in results["scenarios"]:
+        b = base.get(s["key"])
+        if not b:
+            continue
+        cold = (s["cold"]["latency_ms"] - b["cold"]["latency_ms"]) / b["cold"]["latency_ms"] * 100
+        warm = (s["warm"]["latency_ms"]["p50"] - b["warm"]["latency_ms"]["p50"]) / b["warm"]["latency_ms"]["p50"] * 100
+        print(f"  {s['key']:<24} cold {cold:+6.1f}%  warm p50 {warm:+6.1f}%")
+
+async def main_async(args):
+    import httpx
+    from app.main import app
+    from app.config import ALLOWED_BEARER_TOKEN
+    docs_dir = tempfile.mkdtemp(prefix="bench-docs-")
+    server, base_url = serve(docs_dir)
+    headers = {"Authorization": f"Bearer {ALLOWED_BEARER_TOKEN}"}
+    scenarios = []
+    grid = itertools.product(args.kinds.split(","), args.pages, args.questions, args.concurrency)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            for seed, (kind, pages, nq, conc) in enumerate(grid, start=1):
+                s = await run_scenario(client, headers, base_url, docs_dir, kind, pages, nq, conc, args.requests, seed)
+                scenarios.append(s)
+                w = s["warm"]["latency_ms"]
+                print(f"{s['key']:<24} cold {s['cold']['latency_ms']:9.1f} ms  warm p50 {w['p50']:8.1f} p99 {w['p99']:8.1f} ms"
+                      f"  {s['warm']['requests_per_s']:7.2f} req/s  {s['chunks']} chunks", flush=True)
+    finally:
+        server.shutdown()
+    return scenarios
+
+def main():
+    args = parse_args()
+    configure(args)
+    scenarios = asyncio.run(main_async(args))
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nwrote {args.out}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+
+import os, random
+from email.message import EmailMessage
+from typing import List, Tuple
+
+# Policy-like synthetic documents. Every clause states one fact ("The waiting period for
+# cataract surgery is 24 months."), and questions are drawn from the same facts, so
+# retrieval has a real target.
+
+TERMS = ["waiting period", "grace period", "sub-limit", "co-payment", "deductible", "notice period",
+         "claim settlement time", "room rent cap", "renewal window", "free-look period"]
+TOPICS = ["cataract surgery", "maternity expenses", "organ donor cover", "ambulance charges",
+          "pre-existing diseases", "AYUSH treatment", "day-care procedures", "dental treatment",
+          "mental illness", "bariatric surgery", "hospital cash", "domiciliary care"]
+UNITS = ["days", "months", "percent of sum insured", "rupees thousand", "hours"]
+FILLER = ("Subject to the terms, conditions and exclusions of this Policy, the Company shall indemnify "
+          "the Insured Person for expenses reasonably and necessarily incurred.")
+
+CHARS_PER_PAGE = 2400
+
+def clauses(pages: int, seed: int) -> List[Tuple[str, str]]:
+    # (clause text, question it answers)
+    rng = random.Random(seed)
+    out, size, n = [], 0, 0
+    while size < pages * CHARS_PER_PAGE:
+        n += 1
+        term, topic, unit = rng.choice(TERMS), rng.choice(TOPICS), rng.choice(UNITS)
+        text = f"Clause {n}. The {term} for {topic} is {rng.randint(1, 48)} {unit}. {FILLER}"
+        out.append((text, f"What is the {term} for {topic}?"))
+        size += len(text) + 1
+    return out
+
+def questions(pages: int, seed: int, count: int) -> List[str]:
+    qs = [q for _, q in clauses(pages, seed)]
+    rng = random.Random(seed + 1)
+    return [rng.choice(qs) for _ in range(count)]
+
+def write_pdf(path: str, pages: int, seed: int):
+    import fitz
+    doc = fitz.open()
+    texts = [c for c, _ in clauses(pages, seed)]
+    page_text, size = [], 0
+    for t in texts + [None]:
+        if t is None or size + len(t) > CHARS_PER_PAGE:
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36),
+                                "\n".join(page_text), fontsize=8)
+            page_text, size = [], 0
+        if t is not None:
+            page_text.append(t)
+            size += len(t)
+    doc.save(path)
+    doc.close()
+
+def write_docx(path: str, pages: int, seed: int):
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Synthetic Policy Wording", 0)
+    for t, _ in clauses(pages, seed):
+        doc.add_paragraph(t)
+    doc.save(path)
+
+def write_eml(path: str, pages: int, seed: int):
+    msg = EmailMessage()
+    msg["Subject"] = "Synthetic policy wording"
+    msg["From"] = "policy@example.com"
+    msg["To"] = "claims@example.com"
+    msg.set_content("\n".join(t for t, _ in clauses(pages, seed)))
+    with open(path, "wb") as f:
+        f.write(bytes(msg))
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "eml": write_eml}
+
+def write_document(directory: str, kind: str, pages: int, seed: int) -> str:
+    name = f"doc-{kind}-{pages}p-{seed}.{kind}"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        WRITERS[kind](path, pages, seed)
+    return name
@@ -1,31 +1,56 @@
-from fastapi import APIRouter, UploadFile
-import tempfile
-from services import parser, embedding, pinecone_service
+from fastapi import APIRouter, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import os
+from app import ingest as app_ingest, doccache
+from app.config import FETCH_MAX_BYTES, DOC_CACHE_ENABLED
+from app.jobs import get_ingest_queue
+from services import uploads
 
 router = APIRouter()
 
-@router.post("/")
-async def ingest_document(file: UploadFile):
-    
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(await file.read())
-        file_path = tmp.name
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
-    # Parse
-    if file.filename.endswith(".pdf"):
-        text = parser.parse_pdf(file_path)
-    elif file.filename.endswith(".docx"):
-        text = parser.parse_docx(file_path)
-    else:
-        return {"error": "Unsupported file type"}
+async def _spool_upload(file: UploadFile):
+    # stream the upload in 1 MB reads; the spool moves to a temp file past DOC_SPOOL_MAX_BYTES
+    spool = app_ingest.SpooledDownload()
+    try:
+        while True:
+            data = await file.read(UPLOAD_CHUNK_BYTES)
+            if not data:
+                break
+            if FETCH_MAX_BYTES and spool.size + len(data) > FETCH_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"upload exceeds {FETCH_MAX_BYTES} bytes")
+            await run_in_threadpool(spool.write, data)
+        spool.finish()
+    except BaseException:
+        spool.close()
+        raise
+    return spool
 
-    
-    chunks = parser.chunk_text(text)
+def _ingest_upload(spool, ext, filename):
+    # same path as /hackrx/run: the ingest queue (dedup, stats) -> chunks -> batched embeds -> document shard
+    try:
+        h = spool.content_hash
+        url = f"upload:{filename}"
+        if DOC_CACHE_ENABLED and doccache.get_doc_cache().has(h):
+            spool.close()
+            doc = doccache.FetchedDocument(url, h, None, "hit")
+        else:
+            doc = doccache.FetchedDocument(url, h, app_ingest.FetchResult(spool, ext), "miss")
+        prepared = get_ingest_queue().submit_fetched(doc).done.result()
+        uploads.remember(h, filename)
+        return prepared
+    finally:
+        spool.close()
 
-    
-    embeddings = embedding.embed_text(chunks)
+@router.post("/")
+async def ingest_document(file: UploadFile):
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in (".pdf", ".docx"):
+        return {"error": "Unsupported file type"}
 
-    
-    pinecone_service.upsert_embeddings(chunks, embeddings, metadata={"document_id": file.filename})
+    spool = await _spool_upload(file)
+    doc = await run_in_threadpool(_ingest_upload, spool, ext, file.filename)
 
-    return {"message": "Document processed successfully"}
+    return {"message": "Document processed successfully", "document_id": doc.content_hash,
+            "chunks": doc.n_chunks, "cache": doc.cache}
@@ -1,28 +1,41 @@
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from services import embedding, pinecone_service, gpt_service
+from typing import List, Optional
+from app import doccache, lexical
+from app.config import HYBRID_RETRIEVAL
+from app.vectorstore import get_shards, shard_name
+from app.retrieval import retrieve_many
+from app.reasoner import answer_all
+from services import uploads
 
 router = APIRouter()
 
 class QueryRequest(BaseModel):
     question: str
+    document_ids: Optional[List[str]] = None  # ids returned by /ingest; default: every uploaded document
+
+def _retrieve(question, hashes):
+    store = get_shards(hashes)
+    # Pinecone shards keep no text; read it back from the document cache
+    id_to_text = None if store.has_texts() else doccache.chunk_texts(hashes)
+    searcher = lexical.get_searcher([shard_name(h) for h in hashes]) if HYBRID_RETRIEVAL else None
+    return retrieve_many(store, [question], id_to_text, False, searcher)[0]
 
 @router.post("/")
 async def query_document(req: QueryRequest):
-    
-    query_embedding = embedding.embed_text([req.question])[0]
-
-   
-    matches = pinecone_service.index.query(
-        vector=query_embedding,
-        top_k=5,
-        include_metadata=True
-    )
+    hashes = req.document_ids or await run_in_threadpool(uploads.known)
+    if not hashes:
+        return {"answer": "No documents have been ingested yet.", "rationale": "", "supporting_clauses": []}
 
-    
-    context = "\n\n".join([m.metadata["text"] for m in matches.matches])
+    contexts = await run_in_threadpool(_retrieve, req.question, hashes)
 
-    
-    answer_json = gpt_service.answer_question(req.question, context)
+    # async client with the shared rate limiter and retries
+    out = (await answer_all([req.question], [contexts]))[0]
 
-    return answer_json
+    cited = set(out.get("citations", []))
+    return {
+        "answer": out.get("answer", ""),
+        "rationale": out.get("reasoning", ""),
+        "supporting_clauses": [c["text"] for c in contexts if c["id"] in cited],
+    }
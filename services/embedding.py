@@ -1,10 +1,21 @@
 from openai import OpenAI
+from app.embeddings import token_batches
 
-client = OpenAI()
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
 
 def embed_text(texts):
-    response = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=texts
-    )
-    return [d.embedding for d in response.data]
+    # one request per token-bounded batch instead of one oversized call
+    vectors = []
+    for group in token_batches(texts):
+        response = get_client().embeddings.create(
+            model="text-embedding-3-large",
+            input=[texts[i] for i in group]
+        )
+        vectors.extend(d.embedding for d in response.data)
+    return vectors
@@ -1,5 +1,12 @@
 from openai import OpenAI
-client = OpenAI()
+
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
 
 def answer_question(question, context):
     prompt = f"""
@@ -12,7 +19,7 @@ Question: {question}
 Context:
 {context}
 """
-    completion = client.chat.completions.create(
+    completion = get_client().chat.completions.create(
         model="gpt-4",
         messages=[{"role": "system", "content": prompt}]
     )
@@ -1,8 +1,9 @@
-from pdfminer.high_level import extract_text
 from docx import Document
+from app.ingest import iter_pdf_pages_fast
 
 def parse_pdf(file_path):
-    return extract_text(file_path)
+    # PyMuPDF page extraction shared with the app (parallel for long PDFs)
+    return "\n".join(text for text, _ in iter_pdf_pages_fast(file_path))
 
 def parse_docx(file_path):
     doc = Document(file_path)
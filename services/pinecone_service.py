@@ -1,8 +1,15 @@
 import pinecone
 import os
+from app.pinecone_client import upsert_batched
 
-pinecone.init(api_key=os.environ["PINECONE_API_KEY"], environment=os.environ["PINECONE_ENVIRONMENT"])
-index = pinecone.Index("policy-clauses")
+_index = None
+
+def get_index():
+    global _index
+    if _index is None:
+        pinecone.init(api_key=os.environ["PINECONE_API_KEY"], environment=os.environ["PINECONE_ENVIRONMENT"])
+        _index = pinecone.Index("policy-clauses")
+    return _index
 
 def upsert_embeddings(chunks, embeddings, metadata):
     vectors = []
@@ -12,4 +19,5 @@ def upsert_embeddings(chunks, embeddings, metadata):
             embedding,
             {"text": chunks[i], **metadata}
         ))
-    index.upsert(vectors=vectors)
+    # batched by size and sent in parallel with retries
+    upsert_batched(get_index(), vectors)
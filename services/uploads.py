@@ -0,0 +1,34 @@
+import json
+import os
+import threading
+from app.config import STORAGE_DIR
+
+# content hash -> filename of every document uploaded through /ingest; /query searches these by default
+
+_path = os.path.join(STORAGE_DIR, "uploads.json")
+_lock = threading.Lock()
+
+def _read():
+    if not os.path.exists(_path):
+        return {}
+    try:
+        with open(_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def remember(content_hash, filename):
+    with _lock:
+        known = _read()
+        if known.get(content_hash) == filename:
+            return
+        known[content_hash] = filename
+        os.makedirs(STORAGE_DIR, exist_ok=True)
+        tmp = f"{_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(known, f, ensure_ascii=False)
+        os.replace(tmp, _path)
+
+def known():
+    with _lock:
+        return list(_read())